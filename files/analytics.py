@@ -0,0 +1,126 @@
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+from clients_mirror import normalize_phone
+from intent_router import detect_service, detect_master
+
+logger = logging.getLogger(__name__)
+
+# === Аналитика заявок ===
+CREATED_FORMAT = '%Y-%m-%d %H:%M'
+REBUILD_PAGE = 1000
+DIMENSIONS = ['source', 'service', 'master', 'day', 'hour']
+
+
+class BookingAnalytics:
+    """
+    Счетчики заявок по источнику, услуге, мастеру, дню и часу создания.
+    Обновляются на каждой сохраненной заявке, поэтому запрос статистики не
+    зависит от числа строк в таблице. rebuild() пересчитывает все за один потоковый проход по листу.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = self._empty()
+
+    @staticmethod
+    def _empty():
+        return {'total': 0, **{dimension: Counter() for dimension in DIMENSIONS}}
+
+    @staticmethod
+    def _keys(data: dict) -> dict:
+        """Значения измерений для заявки; свободный текст услуги и мастера приводится к категориям"""
+        service = data.get('Услуга', '')
+        master = data.get('Мастер', '')
+        keys = {
+            'source': data.get('Источник') or 'Неизвестно',
+            'service': detect_service(service) or service.strip() or 'Не указано',
+            'master': detect_master(master) or master.strip() or 'Не указано',
+        }
+        try:
+            created = datetime.strptime(str(data.get('Создано', '')).lstrip("'"), CREATED_FORMAT)
+            keys['day'] = created.strftime('%Y-%m-%d')
+            keys['hour'] = created.hour
+        except ValueError:
+            pass  # старые строки без времени создания
+        return keys
+
+    @staticmethod
+    def _add(counters: dict, keys: dict):
+        counters['total'] += 1
+        for dimension, key in keys.items():
+            counters[dimension][key] += 1
+
+    def record(self, data: dict):
+        """Учитывает только что сохраненную заявку"""
+        keys = self._keys(data)
+        with self._lock:
+            self._add(self._counters, keys)
+
+    def rebuild(self, reader) -> int:
+        """
+        Пересчитывает счетчики по листу заявок постранично.
+        reader(first_row, last_row) возвращает строки листа (колонки A:H).
+        """
+        counters = self._empty()
+        first_row = 1
+        while True:
+            rows = reader(first_row, first_row + REBUILD_PAGE - 1)
+            for values in rows:
+                values = list(values) + [''] * 8
+                # Заголовок и тестовые строки пропускаем: у них нет настоящего телефона
+                if normalize_phone(values[1]) is None:
+                    continue
+                data = dict(zip(['Имя', 'Телефон', 'Услуга', 'Дата', 'Мастер', 'Комментарий', 'Источник', 'Создано'], values))
+                self._add(counters, self._keys(data))
+            if len(rows) < REBUILD_PAGE:
+                break
+            first_row += REBUILD_PAGE
+        with self._lock:
+            self._counters = counters
+        logger.info("Аналитика заявок пересчитана", extra={'fields': {'total': counters['total']}})
+        return counters['total']
+
+    def start_rebuild(self, reader):
+        """Запускает rebuild() в фоновом потоке (при старте бота)"""
+        def run():
+            try:
+                self.rebuild(reader)
+            except Exception as e:
+                logger.error("Ошибка пересчета аналитики: %s", e)
+        threading.Thread(target=run, name='analytics-rebuild', daemon=True).start()
+
+    def stats(self, top: int = 10) -> dict:
+        """Сводка: всего, по источникам, топ услуг и мастеров, по дням и часам"""
+        with self._lock:
+            counters = self._counters
+            return {
+                'total': counters['total'],
+                'by_source': dict(counters['source']),
+                'top_services': counters['service'].most_common(top),
+                'top_masters': counters['master'].most_common(top),
+                'by_day': dict(sorted(counters['day'].items())[-30:]),
+                'by_hour': {hour: counters['hour'][hour] for hour in sorted(counters['hour'])},
+            }
+
+
+booking_analytics = BookingAnalytics()
+
+
+def format_stats(stats: dict) -> str:
+    """Текст для команды /stats в Telegram"""
+    lines = [f"📊 Заявок всего: {stats['total']}", "", "По источникам:"]
+    lines += [f"  {source}: {count}" for source, count in stats['by_source'].items()]
+    lines += ["", "Популярные услуги:"]
+    lines += [f"  {service}: {count}" for service, count in stats['top_services']]
+    lines += ["", "Загрузка мастеров:"]
+    lines += [f"  {master}: {count}" for master, count in stats['top_masters']]
+    if stats['by_day']:
+        lines += ["", "По дням (последние 7):"]
+        lines += [f"  {day}: {count}" for day, count in list(stats['by_day'].items())[-7:]]
+    if stats['by_hour']:
+        busiest = max(stats['by_hour'], key=stats['by_hour'].get)
+        lines += ["", f"Больше всего заявок в {busiest}:00"]
+    return '\n'.join(lines)
@@ -0,0 +1,183 @@
+import os
+import re
+import time
+import logging
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+from intent_router import detect_master
+
+# Загружаем переменные окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# === Настройки зеркала таблицы заявок ===
+CLIENTS_DB_PATH = os.getenv('CLIENTS_DB_PATH', 'clients.db')
+CLIENTS_SYNC_INTERVAL = int(os.getenv('CLIENTS_SYNC_INTERVAL', '300'))  # секунды между синхронизациями
+CLIENTS_SYNC_PAGE = 1000  # строк за один запрос к Sheets
+
+# Колонки листа: Имя, Телефон, Услуга, Дата, Мастер, Комментарий, Источник
+COLUMNS = ['name', 'phone', 'service', 'date', 'master', 'comment', 'source']
+RANGE_ROW_RE = re.compile(r"^'?Лист1'?![A-Z]+(\d+)")  # зеркалируется только лист заявок
+
+
+def normalize_phone(phone: str):
+    """Телефон в виде 7XXXXXXXXXX (только цифры, 8 в начале заменяется на 7) или None"""
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = '7' + digits[1:]
+    return digits if 7 <= len(digits) <= 15 else None
+
+
+class ClientMirror:
+    """
+    Локальная копия листа заявок в SQLite, догружаемая по номеру строки.
+    Поверх нее в памяти - индекс телефон -> клиент (имя, обычный мастер, число визитов),
+    поэтому узнать вернувшегося клиента можно за O(1) без запроса к Sheets.
+    Телефон может ввести кто угодно, поэтому данные клиента показываются только администратору;
+    самому клиенту - лишь если он пишет из того же Telegram-чата, откуда уже записывался на этот номер.
+    """
+
+    def __init__(self, db_path: str = CLIENTS_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = None
+        self._clients = {}  # телефон: {'name', 'master', 'visits'}
+        self._masters = {}  # телефон: {мастер: число записей}
+        self._owners = set()  # (Telegram chat id, телефон) из прошлых записей через бота
+        self._reader = None
+        self._thread = None
+
+    def open(self):
+        """Открывает базу и строит индекс клиентов в памяти"""
+        with self._lock:
+            if self._db is not None:
+                return
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(f"""
+                CREATE TABLE IF NOT EXISTS rows (
+                    row INTEGER PRIMARY KEY,
+                    {', '.join(f'{column} TEXT' for column in COLUMNS)}
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS rows_phone ON rows (phone)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS telegram_owners (chat_id TEXT, phone TEXT, PRIMARY KEY (chat_id, phone))"
+            )
+            self._db.commit()
+            self._owners = set(self._db.execute("SELECT chat_id, phone FROM telegram_owners"))
+
+            for name, phone, master in self._db.execute(
+                "SELECT name, phone, master FROM rows WHERE phone IS NOT NULL ORDER BY row"
+            ):
+                self._index(name, phone, master)
+            logger.info("Зеркало заявок загружено", extra={'fields': {'clients': len(self._clients)}})
+
+    def start(self, reader):
+        """
+        Запускает фоновую синхронизацию.
+        reader(first_row, last_row) возвращает строки листа (списки значений).
+        """
+        self.open()
+        self._reader = reader
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sync_loop, name='clients-mirror', daemon=True)
+            self._thread.start()
+
+    def _index(self, name, phone, master):
+        client = self._clients.setdefault(phone, {'name': name, 'master': None, 'visits': 0})
+        client['visits'] += 1
+        if name:
+            client['name'] = name  # последнее указанное имя
+        if master and master.lower() != 'нет' and detect_master(master) != 'Любой':
+            masters = self._masters.setdefault(phone, {})
+            masters[master] = masters.get(master, 0) + 1
+            client['master'] = max(masters, key=masters.get)
+
+    def _insert(self, row_number: int, values: list) -> bool:
+        """Добавляет строку листа, если ее еще нет. Вызывается под _lock"""
+        values = (list(values) + [''] * len(COLUMNS))[:len(COLUMNS)]
+        record = dict(zip(COLUMNS, (str(v).strip() for v in values)))
+        record['phone'] = normalize_phone(record['phone'])
+        cursor = self._db.execute(
+            f"INSERT OR IGNORE INTO rows (row, {', '.join(COLUMNS)}) VALUES (?, {', '.join('?' * len(COLUMNS))})",
+            [row_number] + [record[column] for column in COLUMNS]
+        )
+        if cursor.rowcount and record['phone']:
+            self._index(record['name'], record['phone'], record['master'])
+        return bool(cursor.rowcount)
+
+    def _synced_rows(self) -> int:
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'synced_rows'").fetchone()
+        return int(row[0]) if row else 0
+
+    def sync(self) -> int:
+        """Догружает из листа строки после последней синхронизированной. Возвращает число новых"""
+        with self._lock:
+            offset = self._synced_rows()
+        added = 0
+        while True:
+            # Запрос к Sheets выполняется без блокировки: поиск клиентов в это время не ждет
+            rows = self._reader(offset + 1, offset + CLIENTS_SYNC_PAGE)
+            if not rows:
+                break
+            with self._lock:
+                for i, values in enumerate(rows):
+                    added += self._insert(offset + 1 + i, values)
+                offset += len(rows)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_rows', ?)", (str(offset),)
+                )
+                self._db.commit()
+            if len(rows) < CLIENTS_SYNC_PAGE:
+                break
+        return added
+
+    def _sync_loop(self):
+        while True:
+            try:
+                added = self.sync()
+                if added:
+                    logger.info("Зеркало заявок обновлено", extra={'fields': {'added_rows': added}})
+            except Exception as e:
+                logger.error("Ошибка синхронизации зеркала заявок: %s", e)
+            time.sleep(CLIENTS_SYNC_INTERVAL)
+
+    def record_application(self, data: dict, updated_range: str = None, chat_id=None):
+        """
+        Сразу добавляет только что сохраненную заявку, не дожидаясь синхронизации.
+        updated_range - диапазон из ответа Sheets ('Лист1!A12:G12'), по нему известен номер строки.
+        chat_id - Telegram-чат клиента: запоминается как владелец телефона.
+        """
+        match = RANGE_ROW_RE.search(updated_range or '')
+        if match is None or self._db is None:
+            return
+        values = [data.get(key, '') for key in ['Имя', 'Телефон', 'Услуга', 'Дата', 'Мастер', 'Комментарий', 'Источник']]
+        phone = normalize_phone(data.get('Телефон'))
+        with self._lock:
+            self._insert(int(match.group(1)), values)
+            if chat_id is not None and phone:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO telegram_owners (chat_id, phone) VALUES (?, ?)", (str(chat_id), phone)
+                )
+                self._owners.add((str(chat_id), phone))
+            self._db.commit()
+
+    def lookup(self, phone: str):
+        """Клиент по телефону: {'name', 'master', 'visits'} или None"""
+        phone = normalize_phone(phone)
+        if phone is None:
+            return None
+        client = self._clients.get(phone)
+        return dict(client) if client else None
+
+    def is_owner(self, phone: str, chat_id) -> bool:
+        """Записывался ли клиент из этого Telegram-чата на этот телефон раньше"""
+        return (str(chat_id), normalize_phone(phone)) in self._owners
+
+
+client_mirror = ClientMirror()
@@ -1,5 +1,6 @@
 import os
 import json
+import logging
 import pytz
 import requests
 from dotenv import load_dotenv
@@ -11,12 +12,14 @@ from googleapiclient.discovery import build
 # === Telegram ===
 from telegram import Bot
 
-# === OpenAI Assistant ===
-import openai
+# === LLM ===
+from resilient_llm import resilient_llm
 
 # Загрузка переменных окружения
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # === Инициализация Google Sheets ===
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 GOOGLE_SHEET_ID = os.getenv('GOOGLE_SHEET_ID')
@@ -33,10 +36,6 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_ADMIN_CHAT_ID = os.getenv('TELEGRAM_ADMIN_CHAT_ID')
 bot = Bot(token=TELEGRAM_BOT_TOKEN)
 
-# === Инициализация OpenAI Assistant ===
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-OPENAI_ASSISTANT_ID = os.getenv('OPENAI_ASSISTANT_ID')
-
 def test_google_sheets():
     """
     Тестирует подключение к Google Sheets
@@ -75,8 +74,9 @@ def save_application_to_sheets(data: dict):
     """
     Сохраняет заявку в Google Sheets.
     data: {
-        'Имя', 'Телефон', 'Услуга', 'Дата', 'Мастер', 'Комментарий', 'Источник'
+        'Имя', 'Телефон', 'Услуга', 'Дата', 'Мастер', 'Комментарий', 'Источник', 'Создано'
     }
+    Возвращает диапазон, в который записана строка (например, 'Лист1!A12:G12').
     """
     values = [[
         data.get('Имя', ''),
@@ -85,34 +85,50 @@ def save_application_to_sheets(data: dict):
         data.get('Дата', ''),
         data.get('Мастер', ''),
         data.get('Комментарий', ''),
-        data.get('Источник', '')
+        data.get('Источник', ''),
+        # Апостроф: Sheets хранит время создания как текст и не меняет формат при чтении
+        f"'{data['Создано']}" if data.get('Создано') else ''
     ]]
     
     try:
-        print("Пробуем сохранить данные:", values)
+        logger.debug("Пробуем сохранить данные: %s", values)
         # Пробуем использовать русское название листа
-        sheets_service.spreadsheets().values().append(
+        result = sheets_service.spreadsheets().values().append(
             spreadsheetId=GOOGLE_SHEET_ID,
             range="Лист1!A1",  # Используем правильное название листа
             valueInputOption="USER_ENTERED",
             body={"values": values}
         ).execute()
-        print("✅ Заявка успешно сохранена в Google Sheets")
+        logger.info("Заявка успешно сохранена в Google Sheets")
+        return result.get('updates', {}).get('updatedRange')
     except Exception as e:
-        print(f"❌ Ошибка при сохранении в Google Sheets: {e}")
+        logger.warning("Ошибка при сохранении в Google Sheets: %s", e)
         # Если не получилось, пробуем без указания листа
         try:
-            sheets_service.spreadsheets().values().append(
+            result = sheets_service.spreadsheets().values().append(
                 spreadsheetId=GOOGLE_SHEET_ID,
                 range="A1",  # Без указания листа
                 valueInputOption="USER_ENTERED",
                 body={"values": values}
             ).execute()
-            print("✅ Заявка сохранена в первый лист")
+            logger.info("Заявка сохранена в первый лист")
+            return result.get('updates', {}).get('updatedRange')
         except Exception as e2:
-            print(f"❌ Критическая ошибка: {e2}")
+            logger.error("Критическая ошибка сохранения в Google Sheets: %s", e2)
             raise e2  # Пробрасываем ошибку дальше
 
+# === Google Sheets: чтение заявок ===
+def read_application_rows(first_row: int, last_row: int, last_column: str = 'G') -> list:
+    """
+    Читает строки листа заявок с first_row по last_row включительно (нумерация с 1),
+    колонки A..last_column. Пустой список - строк больше нет.
+    """
+    result = sheets_service.spreadsheets().values().get(
+        spreadsheetId=GOOGLE_SHEET_ID,
+        range=f"Лист1!A{first_row}:{last_column}{last_row}"
+    ).execute()
+    return result.get('values', [])
+
 # === Telegram: отправка уведомления в служебный чат ===
 async def send_telegram_notification(text: str):
     """
@@ -124,58 +140,25 @@ async def send_telegram_notification(text: str):
         notification_bot = Bot(token=TELEGRAM_BOT_TOKEN)
         
         await notification_bot.send_message(chat_id=TELEGRAM_ADMIN_CHAT_ID, text=text)
-        print("✅ Уведомление отправлено в Telegram")
+        logger.info("Уведомление отправлено в Telegram")
         
         # Закрываем соединение
         await notification_bot.close()
     except Exception as e:
-        print(f"❌ Ошибка отправки уведомления: {e}")
+        logger.error("Ошибка отправки уведомления: %s", e)
 
 # === OpenAI Assistant: получить ответ ассистента ===
-def ask_openai_assistant(messages: list):
+def ask_openai_assistant(messages: list, session_id=None):
     """
-    Отправляет сообщения дообученному ассистенту OpenAI и возвращает ответ.
+    Отправляет сообщения LLM бэкенду текущего развертывания (LLM_BACKEND) и возвращает ответ.
+    Ответ укладывается в бюджет задержки, иначе - запасной ответ (см. resilient_llm).
     messages: список сообщений в формате OpenAI (role, content)
+    session_id: id клиента для передачи вопроса администратору
     """
     try:
-        client = openai.Client(api_key=OPENAI_API_KEY)
-        
-        # Создаем thread
-        thread = client.beta.threads.create()
-        
-        # Добавляем сообщения в thread
-        for message in messages:
-            client.beta.threads.messages.create(
-                thread_id=thread.id,
-                role=message["role"],
-                content=message["content"]
-            )
-        
-        # Запускаем assistant
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=OPENAI_ASSISTANT_ID
-        )
-        
-        # Ожидаем завершения
-        while True:
-            run_status = client.beta.threads.runs.retrieve(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-            if run_status.status == 'completed':
-                break
-            elif run_status.status == 'failed':
-                print(f"❌ Run failed: {run_status.last_error}")
-                return "Извините, произошла ошибка при обработке запроса."
-        
-        # Получаем ответ
-        messages_response = client.beta.threads.messages.list(thread_id=thread.id)
-        answer = messages_response.data[0].content[0].text.value
-        return answer
-        
+        return resilient_llm.ask(messages, session_id)
     except Exception as e:
-        print(f"❌ Ошибка OpenAI Assistant: {e}")
+        logger.error("Ошибка LLM бэкенда: %s", e)
         return "Извините, произошла ошибка при обработке вашего запроса."
 
 # === Вспомогательные функции ===
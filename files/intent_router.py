@@ -0,0 +1,204 @@
+import re
+import time
+import threading
+from dataclasses import dataclass
+
+from reminders import parse_booking_date
+
+# === Локальный роутер намерений для записи ===
+# Фиксированные шаги записи (имя, телефон, услуга, дата, мастер, комментарий)
+# обрабатываются шаблонами без обращения к LLM. Ассистент нужен только для
+# консультаций и непонятных ответов.
+
+SLOTS = ['Имя', 'Телефон', 'Услуга', 'Дата', 'Мастер', 'Комментарий']
+SESSION_TTL = 3600
+MAX_SESSIONS = 50000
+
+PROMPTS = {
+    'Имя': "Как вас зовут?",
+    'Телефон': "Укажите, пожалуйста, ваш номер телефона в формате 79XXXXXXXXX.",
+    'Услуга': "Какая услуга вас интересует? Например: стрижка, окрашивание, маникюр.",
+    'Дата': "На какую дату и время вы хотели бы записаться? (например, '15 сентября в 14:00')",
+    'Мастер': "К мастеру какой категории вас записать: Стилист, Топ-Стилист, Ведущий Стилист или Арт-Директор? Если нет предпочтений, напишите 'любой'.",
+    'Комментарий': "Есть ли дополнительные пожелания? Если нет, напишите 'нет'.",
+}
+REPROMPTS = {
+    'Имя': "Пожалуйста, напишите ваше имя.",
+    'Телефон': "Пожалуйста, введите корректный номер телефона в формате 79XXXXXXXXX.",
+    'Дата': "Не удалось понять дату. Напишите, пожалуйста, число и месяц, например '15 сентября в 14:00'.",
+}
+
+SERVICES = {
+    'стриж': 'Стрижка', 'подстри': 'Стрижка', 'окраш': 'Окрашивание', 'airtouch': 'Окрашивание',
+    'контуринг': 'Окрашивание', 'маникюр': 'Маникюр', 'педикюр': 'Педикюр', 'уклад': 'Укладка',
+    'космет': 'Косметология', 'уход': 'Уход за волосами',
+}
+# Категории ищутся с начала слова: "Светлана Топоркова" или "Любовь" - это имена, а не категории
+MASTERS = [
+    (re.compile(r'\bарт[\s-]?дир|\bдиректор'), 'Арт-Директор'), (re.compile(r'\bведущ'), 'Ведущий Стилист'),
+    (re.compile(r'\bтоп(\b|[\s-]?стилист)'), 'Топ-Стилист'), (re.compile(r'\bстилист'), 'Стилист'),
+    (re.compile(r'\bлюб(ой|ая|ого|ую)\b|\bбез разниц|\bвс[её] равно|\bне знаю'), 'Любой'),
+]
+WEEKDAYS = ['понедельник', 'вторник', 'сред', 'четверг', 'пятниц', 'суббот', 'воскресен']
+
+EXPLICIT_BOOKING_RE = re.compile(
+    r'запиш(и|ите)|записаться|записать(ся)? меня|хочу (на|к) (прием|мастер|стилист)|оформить запись'
+)
+DESIRE_RE = re.compile(r'\b(хочу|хотел[аи]?|нужн[аоы]?|надо)\b')
+QUESTION_RE = re.compile(r'\?|\b(сколько|стоимост|цен\w*|как\b|что\b|каки?[еяой]\b|где\b|когда\b|почему|можно ли)')
+CANCEL_RE = re.compile(r'^(отмена|отменить|стоп|не надо|передумал[аи]?)\b')
+NO_COMMENT = ['нет', 'без комментариев', 'нет комментариев', 'нет пожеланий', 'не', '-']
+
+
+@dataclass
+class RouteResult:
+    """answer - готовый ответ без LLM (None - отдать ассистенту), completed - собранная заявка"""
+    answer: str = None
+    completed: dict = None
+
+
+def detect_service(text: str):
+    content = text.lower()
+    return next((name for stem, name in SERVICES.items() if stem in content), None)
+
+
+def detect_master(text: str):
+    content = text.lower()
+    return next((name for pattern, name in MASTERS if pattern.search(content)), None)
+
+
+def is_booking_intent(text: str) -> bool:
+    """Явное желание записаться: 'запишите меня', 'хочу записаться', 'нужна стрижка' (не вопрос)"""
+    content = text.lower()
+    if EXPLICIT_BOOKING_RE.search(content):
+        # "Как записаться на обучение?" - это вопрос для консультации
+        return not (QUESTION_RE.search(content) and 'обучени' in content)
+    return bool(DESIRE_RE.search(content) and detect_service(content) and not QUESTION_RE.search(content))
+
+
+def parse_slot(slot: str, text: str):
+    """Значение слота из ответа клиента или None, если ответ не подходит"""
+    value = text.strip()
+    content = value.lower()
+    if slot == 'Имя':
+        if 1 < len(value) <= 50 and not any(char.isdigit() for char in value) and not QUESTION_RE.search(content):
+            return value
+        return None
+    if slot == 'Телефон':
+        digits = re.sub(r'\D', '', value)
+        if digits.startswith('8') and len(digits) == 11:
+            digits = '7' + digits[1:]
+        return digits if 7 <= len(digits) <= 15 and len(digits) * 2 >= len(value) else None
+    if slot == 'Услуга':
+        service = detect_service(value)
+        if service:
+            return service
+        return value if len(value) <= 100 and not QUESTION_RE.search(content) else None
+    if slot == 'Дата':
+        if parse_booking_date(value) or any(day in content for day in WEEKDAYS):
+            return value
+        return None
+    if slot == 'Мастер':
+        # Ответ сохраняется как есть, чтобы не потерять имя мастера; категорию дает detect_master.
+        # "А топ-стилист свободен?" - вопрос, а не выбор, даже если в нем названа категория
+        if QUESTION_RE.search(content):
+            return None
+        return value if detect_master(value) or len(value) <= 50 else None
+    if slot == 'Комментарий':
+        if content in NO_COMMENT:
+            return 'нет'
+        return value if not QUESTION_RE.search(content) else None
+    return None
+
+
+class IntentRouter:
+    """
+    Состояние записи по сессиям и выбор: ответить шаблоном или передать LLM.
+    Постоянных клиентов здесь не узнаем: отправитель в веб-чате не подтвержден,
+    поэтому данные клиента по введенному телефону видит только администратор.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id: {'slots': {...}, 'updated': время}
+
+    def _cleanup(self, now: float):
+        if len(self._sessions) > MAX_SESSIONS:
+            self._sessions = {k: v for k, v in self._sessions.items() if now - v['updated'] < SESSION_TTL}
+
+    def _get(self, session_id, now: float):
+        state = self._sessions.get(session_id)
+        if state and now - state['updated'] > SESSION_TTL:
+            del self._sessions[session_id]
+            return None
+        return state
+
+    def in_progress(self, session_id) -> bool:
+        with self._lock:
+            return self._get(session_id, time.time()) is not None
+
+    def route(self, session_id, message: str) -> RouteResult:
+        """Обрабатывает сообщение клиента; RouteResult() без ответа означает 'спросить LLM'"""
+        now = time.time()
+        with self._lock:
+            self._cleanup(now)
+            state = self._get(session_id, now)
+
+            if state is None:
+                if not is_booking_intent(message):
+                    return RouteResult()
+                state = {'slots': {}, 'updated': now}
+                service = detect_service(message)
+                if service:
+                    state['slots']['Услуга'] = service
+                self._sessions[session_id] = state
+                intro = f"Отлично! Давайте запишем вас на услугу «{service}». " if service else "Отлично! Давайте оформим запись. "
+                return RouteResult(answer=intro + PROMPTS[self._next_slot(state)])
+
+            state['updated'] = now
+            if CANCEL_RE.search(message.strip().lower()):
+                del self._sessions[session_id]
+                return RouteResult(answer="Запись отменена. Если появятся вопросы, я на связи!")
+
+            slot = self._next_slot(state)
+            if slot is None:
+                # Прошлая попытка сохранить заявку не удалась: повторяем с теми же данными
+                return self._completed(state)
+            value = parse_slot(slot, message)
+            if value is None:
+                # Вопрос посреди записи отдаем ассистенту, шаг записи сохраняется
+                if QUESTION_RE.search(message.lower()):
+                    return RouteResult()
+                return RouteResult(answer=REPROMPTS.get(slot, PROMPTS[slot]))
+
+            state['slots'][slot] = value
+            slot = self._next_slot(state)
+            if slot:
+                return RouteResult(answer=PROMPTS[slot])
+
+            return self._completed(state)
+
+    def finish(self, session_id):
+        """Закрывает сессию после успешного сохранения заявки"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    @staticmethod
+    def _completed(state) -> RouteResult:
+        """Все слоты собраны; сессия живет до finish(), чтобы при ошибке сохранения заявка не потерялась"""
+        data = state['slots']
+        return RouteResult(
+            answer=(
+                f"Отлично, {data['Имя']}! Ваша запись оформлена:\n"
+                f"Услуга: {data['Услуга']}\nДата: {data['Дата']}\nМастер: {data['Мастер']}\n\n"
+                f"Мы свяжемся с вами для подтверждения записи!"
+            ),
+            completed=dict(data),
+        )
+
+    @staticmethod
+    def _next_slot(state):
+        return next((slot for slot in SLOTS if slot not in state['slots']), None)
+
+
+intent_router = IntentRouter()
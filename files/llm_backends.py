@@ -0,0 +1,315 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+# === OpenAI ===
+import openai
+
+# Загружаем переменные окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# === Настройки LLM ===
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_ASSISTANT_ID = os.getenv('OPENAI_ASSISTANT_ID')
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'assistants')  # assistants | chat | stub
+LLM_PROMPT_PATH = os.getenv('LLM_PROMPT_PATH', os.path.join(BASE_DIR, 'промпт.txt'))
+LLM_KNOWLEDGE_PATH = os.getenv('LLM_KNOWLEDGE_PATH', os.path.join(BASE_DIR, 'knowledge.txt'))
+RUN_POLL_INTERVAL = 0.3
+RUN_TIMEOUT = float(os.getenv('LLM_RUN_TIMEOUT', '60'))  # предел ожидания run, даже если ответ уже не нужен
+HTTP_TIMEOUT = float(os.getenv('LLM_HTTP_TIMEOUT', '30'))
+LATENCY_WINDOW = 200
+
+# Цены, USD за 1M токенов: (вход, вход из кэша, выход)
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4.1-mini': (0.40, 0.10, 1.60),
+    'gpt-4.1': (2.00, 0.50, 8.00),
+}
+
+
+class LLMError(Exception):
+    """Ошибка бэкенда: запрос не выполнен и ответа нет"""
+
+
+@dataclass
+class LLMResult:
+    text: str
+    backend: str
+    model: str = ''
+    latency: float = 0.0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+
+
+def estimate_cost(model: str, input_tokens: int, cached_tokens: int, output_tokens: int) -> float:
+    """Стоимость запроса в USD по таблице цен; неизвестная модель - 0"""
+    prices = next((p for name, p in sorted(MODEL_PRICES.items(), key=lambda i: -len(i[0]))
+                   if model.startswith(name)), None)
+    if prices is None:
+        return 0.0
+    price_in, price_cached, price_out = prices
+    return ((input_tokens - cached_tokens) * price_in + cached_tokens * price_cached
+            + output_tokens * price_out) / 1_000_000
+
+
+def load_knowledge(path: str = LLM_KNOWLEDGE_PATH) -> list:
+    """База знаний: список пар (вопрос, ответ) из knowledge.txt"""
+    with open(path, encoding='utf-8') as f:
+        return [(item['Вопросы'].strip(), item['Ответы'].strip()) for item in json.load(f)]
+
+
+def build_system_prefix(prompt_path: str = LLM_PROMPT_PATH, knowledge_path: str = LLM_KNOWLEDGE_PATH) -> str:
+    """
+    Статический системный префикс: промпт + база знаний.
+    Собирается один раз и не содержит ничего переменного (дат, id), поэтому
+    байт-в-байт совпадает между запросами и попадает в кэш промптов провайдера.
+    """
+    with open(prompt_path, encoding='utf-8') as f:
+        prompt = f.read().replace('\r\n', '\n').strip()
+    knowledge = '\n\n'.join(f"Вопрос: {q}\nОтвет: {a}" for q, a in load_knowledge(knowledge_path))
+    return f"{prompt}\n\nБАЗА ЗНАНИЙ САЛОНА:\n\n{knowledge}\n"
+
+
+class BackendStats:
+    """Задержка, токены и стоимость по бэкенду"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+
+    def record(self, result: LLMResult):
+        with self._lock:
+            self.calls += 1
+            self.total_latency += result.latency
+            self.latencies.append(result.latency)
+            self.input_tokens += result.input_tokens
+            self.cached_tokens += result.cached_tokens
+            self.output_tokens += result.output_tokens
+            self.cost += result.cost
+
+    def record_error(self, latency: float):
+        with self._lock:
+            self.calls += 1
+            self.errors += 1
+            self.latencies.append(latency)
+
+    def percentile(self, q: float):
+        """Перцентиль задержки по последним LATENCY_WINDOW вызовам, None если данных нет"""
+        with self._lock:
+            window = sorted(self.latencies)
+        if not window:
+            return None
+        return window[min(len(window) - 1, int(q * len(window)))]
+
+    def summary(self) -> dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        with self._lock:
+            ok_calls = self.calls - self.errors
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'avg_latency_ms': round(self.total_latency * 1000 / ok_calls, 1) if ok_calls else None,
+                'p50_latency_ms': round(p50 * 1000, 1) if p50 is not None else None,
+                'p95_latency_ms': round(p95 * 1000, 1) if p95 is not None else None,
+                'input_tokens': self.input_tokens,
+                'cached_tokens': self.cached_tokens,
+                'output_tokens': self.output_tokens,
+                'cost_usd': round(self.cost, 6),
+            }
+
+
+class LLMBackend(ABC):
+    """Базовый бэкенд: complete() замеряет задержку и пишет статистику, _complete() - сам запрос"""
+
+    name = 'base'
+
+    def __init__(self):
+        self.stats = BackendStats()
+
+    def complete(self, messages: list) -> LLMResult:
+        started = time.perf_counter()
+        try:
+            result = self._complete(messages)
+        except Exception:
+            self.stats.record_error(time.perf_counter() - started)
+            raise
+        result.latency = time.perf_counter() - started
+        result.cost = estimate_cost(result.model, result.input_tokens, result.cached_tokens, result.output_tokens)
+        self.stats.record(result)
+        return result
+
+    @abstractmethod
+    def _complete(self, messages: list) -> LLMResult:
+        """Сам запрос к модели; задержку и статистику считает complete()"""
+
+
+class AssistantsBackend(LLMBackend):
+    """Beta Assistants API: thread + run + опрос статуса (промпт и знания хранятся у ассистента)"""
+
+    name = 'assistants'
+
+    def __init__(self, assistant_id: str = OPENAI_ASSISTANT_ID):
+        super().__init__()
+        self.assistant_id = assistant_id
+        self.client = openai.Client(api_key=OPENAI_API_KEY, timeout=HTTP_TIMEOUT, max_retries=1)
+
+    def _complete(self, messages: list) -> LLMResult:
+        # Thread создается сразу с историей - один запрос вместо одного на сообщение
+        thread = self.client.beta.threads.create(
+            messages=[{"role": m["role"], "content": m["content"]} for m in messages]
+        )
+        run = self.client.beta.threads.runs.create(thread_id=thread.id, assistant_id=self.assistant_id)
+
+        deadline = time.monotonic() + RUN_TIMEOUT
+        while run.status in ('queued', 'in_progress', 'cancelling'):
+            if time.monotonic() > deadline:
+                self.client.beta.threads.runs.cancel(thread_id=thread.id, run_id=run.id)
+                raise LLMError(f"Run не завершился за {RUN_TIMEOUT:.0f} с")
+            time.sleep(RUN_POLL_INTERVAL)
+            run = self.client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+        if run.status != 'completed':
+            raise LLMError(f"Run {run.status}: {run.last_error}")
+
+        messages_response = self.client.beta.threads.messages.list(thread_id=thread.id, limit=1)
+        usage = run.usage
+        return LLMResult(
+            text=messages_response.data[0].content[0].text.value,
+            backend=self.name,
+            model=run.model or '',
+            input_tokens=usage.prompt_tokens if usage else 0,
+            output_tokens=usage.completion_tokens if usage else 0,
+        )
+
+
+class ChatCompletionsBackend(LLMBackend):
+    """
+    Chat Completions: статический системный префикс + история диалога.
+    Префикс всегда первый и неизменный, так что срабатывает кэширование промптов.
+    """
+
+    name = 'chat'
+
+    def __init__(self, model: str = OPENAI_MODEL, prompt_path: str = LLM_PROMPT_PATH):
+        super().__init__()
+        self.model = model
+        self.system_prefix = build_system_prefix(prompt_path)
+        self.client = openai.Client(api_key=OPENAI_API_KEY, timeout=HTTP_TIMEOUT, max_retries=1)
+
+    def _complete(self, messages: list) -> LLMResult:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "system", "content": self.system_prefix}]
+            + [{"role": m["role"], "content": m["content"]} for m in messages],
+        )
+        usage = response.usage
+        details = getattr(usage, 'prompt_tokens_details', None) if usage else None
+        return LLMResult(
+            text=response.choices[0].message.content or '',
+            backend=self.name,
+            model=response.model,
+            input_tokens=usage.prompt_tokens if usage else 0,
+            cached_tokens=(getattr(details, 'cached_tokens', 0) or 0) if details else 0,
+            output_tokens=usage.completion_tokens if usage else 0,
+        )
+
+
+WORD_RE = re.compile(r'\w+')
+
+
+def word_stems(text: str) -> set:
+    """Грубые основы слов (первые 4 буквы) для сравнения без учета падежей"""
+    return {word[:4] for word in WORD_RE.findall(text.lower()) if len(word) > 3}
+
+
+class StubBackend(LLMBackend):
+    """Локальная детерминированная заглушка без сети: лучший ответ из базы знаний по совпадению слов"""
+
+    name = 'stub'
+    DEFAULT_ANSWER = "Спасибо за вопрос! Администратор салона уточнит детали и свяжется с вами. Хотите записаться на услугу?"
+    MIN_SCORE = 0.5
+
+    def __init__(self, knowledge_path: str = LLM_KNOWLEDGE_PATH):
+        super().__init__()
+        self.knowledge = [(word_stems(f"{q} {a}"), a) for q, a in load_knowledge(knowledge_path)]
+        # Вес основы обратно пропорционален числу вопросов, где она встречается ("сколько" весит мало)
+        frequency = {}
+        for stems, _ in self.knowledge:
+            for stem in stems:
+                frequency[stem] = frequency.get(stem, 0) + 1
+        self.weights = {stem: 1.0 / count for stem, count in frequency.items()}
+
+    def best_answer(self, question: str):
+        """Самый близкий ответ из базы знаний или None, если совпадение слишком слабое"""
+        words = word_stems(question)
+        best_score, answer = self.MIN_SCORE, None
+        for keywords, knowledge_answer in self.knowledge:
+            score = sum(self.weights[stem] for stem in words & keywords)
+            if score > best_score:
+                best_score, answer = score, knowledge_answer
+        return answer
+
+    def _complete(self, messages: list) -> LLMResult:
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), '')
+        answer = self.best_answer(question) or self.DEFAULT_ANSWER
+        return LLMResult(
+            text=answer,
+            backend=self.name,
+            model='stub',
+            input_tokens=sum(len(m["content"]) for m in messages) // 4,
+            output_tokens=len(answer) // 4,
+        )
+
+
+BACKENDS = {
+    AssistantsBackend.name: AssistantsBackend,
+    ChatCompletionsBackend.name: ChatCompletionsBackend,
+    StubBackend.name: StubBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def create_backend(name: str, **options) -> LLMBackend:
+    """Создает бэкенд по имени ('assistants', 'chat', 'stub')"""
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный LLM бэкенд: {name}")
+    return BACKENDS[name](**options)
+
+
+def get_backend(name: str = None) -> LLMBackend:
+    """Бэкенд текущего развертывания (LLM_BACKEND), создается один раз"""
+    name = name or LLM_BACKEND
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = create_backend(name)
+            logger.info("LLM бэкенд: %s", name)
+        return _backends[name]
+
+
+def backend_stats() -> dict:
+    """Статистика задержки и стоимости по всем созданным бэкендам"""
+    with _backends_lock:
+        backends = dict(_backends)
+    return {name: backend.stats.summary() for name, backend in backends.items()}
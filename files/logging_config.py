@@ -0,0 +1,174 @@
+import os
+import re
+import sys
+import copy
+import json
+import uuid
+import queue
+import random
+import atexit
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# === Настройки логирования ===
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.1'))  # доля выводимых DEBUG-записей
+
+# Телефоны: 7-15 цифр, допускаются +, пробелы, скобки и дефисы
+PHONE_RE = re.compile(r'\+?\d[\d\s()\-]{5,18}\d')
+
+session_id_var = contextvars.ContextVar('session_id', default=None)
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+
+def redact_phones(text: str) -> str:
+    """Маскирует номера телефонов, оставляя две последние цифры"""
+    def mask(match):
+        digits = re.sub(r'\D', '', match.group(0))
+        if not 7 <= len(digits) <= 15:
+            return match.group(0)
+        return '*' * (len(digits) - 2) + digits[-2:]
+    return PHONE_RE.sub(mask, text)
+
+
+def _redact_value(value):
+    if isinstance(value, str):
+        return redact_phones(value)
+    if isinstance(value, dict):
+        return {k: _redact_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact_value(v) for v in value]
+    return value
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи session_id и request_id текущего запроса (в потоке вызывающего)"""
+
+    def filter(self, record):
+        record.session_id = session_id_var.get()
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей уровня DEBUG, остальные уровни - целиком"""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON-строка на запись; телефоны маскируются уже в фоновом потоке"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': redact_phones(record.getMessage()),
+        }
+        if getattr(record, 'session_id', None):
+            entry['session_id'] = str(record.session_id)
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(_redact_value(fields))
+        if record.exc_info:
+            entry['exc'] = redact_phones(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Кладет запись в ограниченную очередь и никогда не ждет: при переполнении запись отбрасывается"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        """
+        В отличие от QueueHandler.prepare не форматирует запись в вызывающем потоке:
+        подставляются только аргументы сообщения, а трассировка (exc_info) форматируется
+        JsonFormatter в фоновом потоке и попадает в отдельное поле 'exc'
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+_listener = None
+
+
+def setup_logging():
+    """
+    Настраивает корневой логгер: запись из рабочих потоков уходит в очередь,
+    а вывод в stdout (и форматирование в JSON) выполняет отдельный поток.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter({logging.DEBUG: LOG_DEBUG_SAMPLE_RATE}))
+    queue_handler.addFilter(ContextFilter())
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    # Библиотеки HTTP-клиентов слишком разговорчивы на DEBUG
+    for name in ('httpx', 'httpcore', 'urllib3', 'googleapiclient', 'telegram'):
+        logging.getLogger(name).setLevel(max(logging.INFO, root.level))
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+@contextmanager
+def log_context(session_id=None):
+    """Привязывает к логам id сессии и новый id запроса на время блока"""
+    session_token = session_id_var.set(session_id)
+    request_token = request_id_var.set(uuid.uuid4().hex[:12])
+    try:
+        yield
+    finally:
+        request_id_var.reset(request_token)
+        session_id_var.reset(session_token)
+
+
+def telegram_log_context(handler):
+    """
+    Декоратор async-обработчиков Telegram: логи привязаны к пользователю на время вызова.
+    PTB по умолчанию выполняет обработчики в одной задаче, поэтому контекст
+    обязательно сбрасывается после обработчика, иначе он достанется следующему апдейту.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        user = update.effective_user
+        with log_context(user.id if user else None):
+            return await handler(update, context)
+    return wrapper
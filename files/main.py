@@ -1,24 +1,56 @@
 import os
+import hmac
 import asyncio
 import threading
 import time
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram.constants import ChatAction
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler, ContextTypes
-from functions import save_application_to_sheets, send_telegram_notification, ask_openai_assistant, validate_phone
+from llm_backends import backend_stats
+from resilient_llm import resilient_llm
+from shadow import shadow_runner
+from functions import save_application_to_sheets, read_application_rows, send_telegram_notification, ask_openai_assistant, validate_phone
+from reminders import reminder_scheduler, schedule_booking_reminder, SALON_TIMEZONE
+from spam_filter import spam_filter, rejection_reply
+from intent_router import intent_router, is_booking_intent, detect_service
+from state_journal import state_journal, JournalPersistence
+from clients_mirror import client_mirror
+from analytics import booking_analytics, format_stats, CREATED_FORMAT
+from datetime import datetime
+import profiling
+import logging
+from logging_config import setup_logging, log_context, telegram_log_context
+from static_assets import AssetRegistry, asset_response, CACHE_IMMUTABLE, CACHE_LOADER, CACHE_REVALIDATE
+from profiling import profiled, handler_profiler, sample_process, format_folded
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
 load_dotenv()
 
+# Логи пишутся через очередь в фоновом потоке, чтобы медленный stdout не блокировал обработчики
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Статика веб-чата читается и сжимается один раз при старте
+webchat_assets = AssetRegistry()
+
 # === Flask-приложение ===
 app = Flask(__name__)
+# Число доверенных прокси перед приложением: X-Forwarded-For учитывается только от них,
+# иначе клиент может подставить любой IP и обойти лимиты фильтра спама
+PROXY_HOPS = int(os.getenv('PROXY_HOPS', '0'))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
 CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]}})
 
 # === Telegram Bot ===
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-application = Application.builder().token(TELEGRAM_BOT_TOKEN).connect_timeout(30).read_timeout(30).write_timeout(30).build()
+TELEGRAM_ADMIN_CHAT_ID = os.getenv('TELEGRAM_ADMIN_CHAT_ID')
+# Состояния диалогов пишутся в журнал и переживают перезапуск
+application = Application.builder().token(TELEGRAM_BOT_TOKEN).connect_timeout(30).read_timeout(30).write_timeout(30).persistence(JournalPersistence()).build()
 
 # === Состояния для ConversationHandler ===
 CHOOSING, TYPING_NAME, TYPING_PHONE, TYPING_SERVICE, TYPING_DATE, TYPING_MASTER = range(6)
@@ -40,6 +72,17 @@ user_histories = {}  # user_id: [messages]
 user_data = {}  # user_id: {form_data}
 HISTORY_LIMIT = 30
 
+def set_form_field(user_id, field, value):
+    """Записывает поле анкеты в память и в журнал состояния"""
+    user_data.setdefault(user_id, {})[field] = value
+    state_journal.record_field(user_id, field, value)
+
+def reset_form(user_id):
+    """Очищает анкету пользователя (в памяти и в журнале)"""
+    if user_data.pop(user_id, None) is not None:
+        state_journal.drop_form(user_id)
+
+@profiled('extract_user_data')
 def extract_user_data(messages):
     """Извлекает данные пользователя из истории сообщений"""
     data = {}
@@ -72,9 +115,33 @@ def extract_user_data(messages):
             elif not data.get('Комментарий') and (content in ['нет', 'без комментариев', 'нет комментариев', 'нте'] or 'комментари' in content):
                 data['Комментарий'] = original_content
     
-    print(f"Извлеченные данные: {data}")  # Отладочный вывод
+    logger.debug("Извлеченные данные", extra={'fields': {'data': data}})
     return data
 
+async def finalize_application(data, chat_id=None):
+    """Сохраняет заявку, уведомляет администратора и планирует напоминание клиенту"""
+    data.setdefault('Создано', datetime.now(SALON_TIMEZONE).strftime(CREATED_FORMAT))
+    
+    # Постоянного клиента ищем до сохранения: данные из зеркала видит только администратор
+    client = client_mirror.lookup(data['Телефон'])
+
+    # Сохраняем в Google Sheets и сразу добавляем в локальное зеркало
+    updated_range = save_application_to_sheets(data)
+    client_mirror.record_application(data, updated_range, chat_id)
+    booking_analytics.record(data)
+
+    # Отправляем уведомление в Telegram
+    notification_text = f"🎉 НОВАЯ ЗАЯВКА!\n\nИмя: {data['Имя']}\nТелефон: {data['Телефон']}\nУслуга: {data['Услуга']}\nДата: {data['Дата']}\nМастер: {data['Мастер']}\nИсточник: {data['Источник']}"
+    if client:
+        notification_text += f"\n\n🔁 Постоянный клиент: {client.get('name') or '-'}, записей: {client['visits']}, обычный мастер: {client.get('master') or '-'}"
+    await send_telegram_notification(notification_text)
+
+    # Напоминание накануне визита
+    try:
+        schedule_booking_reminder(data, chat_id)
+    except Exception as e:
+        logger.exception("Ошибка планирования напоминания: %s", e)
+
 async def try_save_application(user_id, source="Web"):
     """Пытается сохранить заявку, если собраны все необходимые данные"""
     try:
@@ -92,22 +159,15 @@ async def try_save_application(user_id, source="Web"):
             if 'Комментарий' not in data:
                 data['Комментарий'] = 'нет'
                 
-            print(f"Попытка сохранить данные: {data}")
-            
-            # Сохраняем в Google Sheets
-            save_application_to_sheets(data)
-            print(f"✅ Заявка успешно сохранена: {data}")
-            
-            # Отправляем уведомление в Telegram
-            notification_text = f"🎉 НОВАЯ ЗАЯВКА!\n\nИмя: {data['Имя']}\nТелефон: {data['Телефон']}\nУслуга: {data['Услуга']}\nДата: {data['Дата']}\nМастер: {data['Мастер']}\nИсточник: {data['Источник']}"
-            await send_telegram_notification(notification_text)
+            await finalize_application(data)
+            logger.info("Заявка успешно сохранена", extra={'fields': {'source': source}})
             
             # Очищаем историю после успешного сохранения
             user_histories[user_id] = []
             
             return True, "Заявка успешно сохранена"
     except Exception as e:
-        print(f"❌ Ошибка при сохранении заявки: {e}")
+        logger.exception("Ошибка при сохранении заявки: %s", e)
         return False, f"Ошибка при сохранении: {str(e)}"
     
     return False, "Недостаточно данных"
@@ -115,235 +175,208 @@ async def try_save_application(user_id, source="Web"):
 # === Flask endpoint для веб-виджета (Tilda) ===
 @app.route('/webchat', methods=['GET'])
 def webchat_page():
-    """Отображает HTML страницу веб-чата"""
-    return '''
-<!DOCTYPE html>
-<html lang="ru">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Чат с салоном красоты</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            max-width: 600px;
-            margin: 50px auto;
-            padding: 20px;
-            background-color: #f5f5f5;
-        }
-        .chat-container {
-            background: white;
-            border-radius: 10px;
-            padding: 20px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }
-        .chat-messages {
-            height: 400px;
-            overflow-y: auto;
-            border: 1px solid #ddd;
-            padding: 15px;
-            margin-bottom: 15px;
-            border-radius: 5px;
-            background-color: #fafafa;
-        }
-        .message {
-            margin-bottom: 15px;
-            padding: 10px;
-            border-radius: 10px;
-            max-width: 80%;
-        }
-        .user-message {
-            background-color: #007bff;
-            color: white;
-            margin-left: auto;
-            text-align: right;
-        }
-        .bot-message {
-            background-color: #e9ecef;
-            color: #333;
-        }
-        .input-container {
-            display: flex;
-            gap: 10px;
-        }
-        #messageInput {
-            flex: 1;
-            padding: 10px;
-            border: 1px solid #ddd;
-            border-radius: 5px;
-        }
-        #sendButton {
-            padding: 10px 20px;
-            background-color: #007bff;
-            color: white;
-            border: none;
-            border-radius: 5px;
-            cursor: pointer;
-        }
-        #sendButton:hover {
-            background-color: #0056b3;
-        }
-        .loading {
-            color: #666;
-            font-style: italic;
-        }
-    </style>
-</head>
-<body>
-    <div class="chat-container">
-        <h2>💄 Чат с салоном красоты ArtBeauty</h2>
-        <div class="chat-messages" id="chatMessages">
-            <div class="message bot-message">
-                Здравствуйте! Я помогу вам записаться на услуги нашего салона или отвечу на ваши вопросы. Чем могу помочь?
-            </div>
-        </div>
-        <div class="input-container">
-            <input type="text" id="messageInput" placeholder="Введите ваше сообщение..." />
-            <button id="sendButton">Отправить</button>
-        </div>
-    </div>
-
-    <script>
-        const chatMessages = document.getElementById('chatMessages');
-        const messageInput = document.getElementById('messageInput');
-        const sendButton = document.getElementById('sendButton');
-
-        function addMessage(text, isUser = false) {
-            const messageDiv = document.createElement('div');
-            messageDiv.className = `message ${isUser ? 'user-message' : 'bot-message'}`;
-            messageDiv.textContent = text;
-            chatMessages.appendChild(messageDiv);
-            chatMessages.scrollTop = chatMessages.scrollHeight;
-        }
-
-        // Создаем постоянный ID для сессии
-        let sessionId = localStorage.getItem('webchat_session_id');
-        if (!sessionId) {
-            sessionId = 'web_' + Date.now();
-            localStorage.setItem('webchat_session_id', sessionId);
-        }
-
-        async function sendMessage() {
-            const message = messageInput.value.trim();
-            if (!message) return;
-
-            addMessage(message, true);
-            messageInput.value = '';
-            sendButton.disabled = true;
-            sendButton.textContent = 'Отправляется...';
-
-            try {
-                const response = await fetch('/webchat', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        message: message,
-                        user_id: sessionId
-                    })
-                });
-
-                const data = await response.json();
-                
-                if (data.answer) {
-                    addMessage(data.answer);
-                } else {
-                    addMessage('Извините, произошла ошибка. Попробуйте позже.');
-                }
-            } catch (error) {
-                console.error('Ошибка:', error);
-                addMessage('Извините, произошла ошибка соединения. Попробуйте позже.');
-            } finally {
-                sendButton.disabled = false;
-                sendButton.textContent = 'Отправить';
-                messageInput.focus();
-            }
-        }
-
-        sendButton.addEventListener('click', sendMessage);
-        messageInput.addEventListener('keypress', (e) => {
-            if (e.key === 'Enter') {
-                sendMessage();
-            }
-        });
-
-        messageInput.focus();
-    </script>
-</body>
-</html>
-    '''
+    """Отображает HTML страницу веб-чата (ETag + 304, сжатие выбрано заранее)"""
+    return asset_response(webchat_assets.page, request, CACHE_REVALIDATE)
+
+@app.route('/webchat/static/<path:filename>', methods=['GET'])
+def webchat_static(filename):
+    """Статика виджета: адреса с хешем содержимого кэшируются навсегда"""
+    asset = webchat_assets.get(filename)
+    if asset is None:
+        return jsonify({"error": "Not found"}), 404
+    cache_control = CACHE_IMMUTABLE if filename == asset.hashed_name else CACHE_REVALIDATE
+    return asset_response(asset, request, cache_control)
+
+@app.route('/webchat/loader.js', methods=['GET'])
+def webchat_loader():
+    """Встраиваемый скрипт для сайта: лениво открывает чат в iframe по клику"""
+    return asset_response(webchat_assets.get('loader.js'), request, CACHE_LOADER)
 
 @app.route('/webchat', methods=['POST'])
+@profiled('webchat')
 def webchat():
+    data = request.get_json(silent=True)
+    if not data:
+        logger.info("Запрос к /webchat без JSON данных")
+        return jsonify({"error": "No JSON data"}), 400
+    
+    user_id = data.get('user_id', 'web')
+    with log_context(user_id):
+        return _webchat_reply(user_id, data.get('message', ''))
+
+def _webchat_reply(user_id, user_message):
+    """Обрабатывает сообщение веб-чата; логи привязаны к сессии и запросу"""
+    started = time.perf_counter()
     try:
-        print("Получен запрос к /webchat")  # Отладочный вывод
-        data = request.get_json()
-        if not data:
-            print("Нет JSON данных")  # Отладочный вывод
-            return jsonify({"error": "No JSON data"}), 400
-            
-        user_id = data.get('user_id', 'web')
-        user_message = data.get('message', '')
-        
-        print(f"ID пользователя: {user_id}")  # Отладочный вывод
-        print(f"Сообщение: {user_message}")  # Отладочный вывод
-        
         if not user_message:
-            print("Нет сообщения")  # Отладочный вывод
+            logger.info("Запрос к /webchat без сообщения")
             return jsonify({"error": "No message provided"}), 400
+        
+        logger.debug("Сообщение: %s", user_message)
+        
+        # Локальный фильтр спама до обращения к ассистенту
+        allowed, reason = spam_filter.check(user_message, str(user_id), request.remote_addr or '')
+        if not allowed:
+            logger.info("Сообщение отклонено фильтром", extra={'fields': {'reason': reason}})
+            return jsonify({"answer": rejection_reply(reason)})
             
         history = user_histories.get(user_id, [])
         history.append({"role": "user", "content": user_message})
         history = history[-HISTORY_LIMIT:]
         
-        # Пробуем сохранить заявку после каждого сообщения (синхронно)
-        saved, save_message = asyncio.run(try_save_application(user_id))
-        if saved:
-            print(f"✅ {save_message}")
-        
-        print("Отправляем запрос ассистенту...")  # Отладочный вывод
-        answer = ask_openai_assistant(history)
-        print(f"Получен ответ: {answer}")  # Отладочный вывод
+        # Шаги записи обрабатываются локально, без обращения к ассистенту
+        route = intent_router.route(user_id, user_message)
+        llm_ms = None
+        if route.answer is not None:
+            answer = route.answer
+            saved = False
+            if route.completed:
+                data = dict(route.completed, Источник='Web')
+                try:
+                    asyncio.run(finalize_application(data))
+                    intent_router.finish(user_id)
+                    saved = True
+                except Exception as e:
+                    # Сессия роутера сохраняется: следующее сообщение клиента повторит сохранение
+                    logger.exception("Ошибка при сохранении заявки: %s", e)
+                    answer = (
+                        "Извините, произошла ошибка при сохранении заявки. "
+                        "Напишите любое сообщение, чтобы попробовать еще раз, или 'отмена'."
+                    )
+        else:
+            # Пробуем сохранить заявку после каждого сообщения (синхронно).
+            # Во время записи через роутер (вопрос посреди шагов) заявку сохранит сам роутер
+            saved = False
+            if not intent_router.in_progress(user_id):
+                saved, save_message = asyncio.run(try_save_application(user_id))
+            
+            llm_started = time.perf_counter()
+            answer = ask_openai_assistant(history, user_id)
+            llm_ms = round((time.perf_counter() - llm_started) * 1000, 1)
+            logger.debug("Ответ ассистента: %s", answer)
         
         history.append({"role": "assistant", "content": answer})
-        user_histories[user_id] = history
+        # После сохранения заявки начинаем историю заново
+        user_histories[user_id] = [] if saved else history
         
+        logger.info("Ответ веб-чата отправлен", extra={'fields': {
+            'message_len': len(user_message),
+            'answer_len': len(answer),
+            'saved': saved,
+            'llm_ms': llm_ms,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        }})
         return jsonify({"answer": answer})
     except Exception as e:
-        print(f"Ошибка в /webchat: {e}")  # Отладочный вывод
+        logger.exception("Ошибка в /webchat: %s", e)
         return jsonify({"error": str(e)}), 500
 
+# === Отладочные эндпоинты профилирования ===
+def debug_authorized():
+    """Проверяет токен доступа к отладочным эндпоинтам (заголовок X-Debug-Token)"""
+    token = request.headers.get('X-Debug-Token', '')
+    return bool(profiling.DEBUG_TOKEN) and hmac.compare_digest(token, profiling.DEBUG_TOKEN)
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """Сэмплирующий профиль всего процесса за ?seconds=N, в формате collapsed stacks"""
+    if not debug_authorized():
+        return jsonify({"error": "Not found"}), 404
+    seconds = request.args.get('seconds', 10, type=float)
+    stacks = sample_process(seconds)
+    if stacks is None:
+        return jsonify({"error": "Profiling already in progress"}), 409
+    return Response(format_folded(stacks), mimetype='text/plain')
+
+@app.route('/debug/profile/handlers', methods=['GET'])
+def debug_profile_handlers():
+    """Сводка профилирования по обработчикам; ?rate=0.1 включает сэмплирование, ?format=folded - стеки"""
+    if not debug_authorized():
+        return jsonify({"error": "Not found"}), 404
+    if 'rate' in request.args:
+        profiling.set_sample_rate(request.args.get('rate', 0, type=float))
+    if request.args.get('reset'):
+        handler_profiler.reset()
+    if request.args.get('format') == 'folded':
+        return Response(handler_profiler.folded(request.args.get('handler')), mimetype='text/plain')
+    return jsonify({"sample_rate": profiling.PROFILE_SAMPLE_RATE, "handlers": handler_profiler.summary()})
+
+@app.route('/debug/llm', methods=['GET'])
+def debug_llm():
+    """Задержка, токены и стоимость по LLM бэкендам, состояние предохранителя"""
+    if not debug_authorized():
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({**backend_stats(), 'resilience': resilient_llm.summary()})
+
+@app.route('/debug/shadow', methods=['GET'])
+def debug_shadow():
+    """Сравнение текущего LLM бэкенда с кандидатом из теневого режима"""
+    if not debug_authorized():
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(shadow_runner.report())
+
+@app.route('/stats', methods=['GET'])
+def stats_json():
+    """Статистика заявок для администраторов (тот же токен, что и у отладочных эндпоинтов)"""
+    if not debug_authorized():
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(booking_analytics.stats())
+
 # === Telegram Handlers ===
+@telegram_log_context
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало разговора с ботом"""
+    # /start посреди записи начинает все заново: брошенная анкета не должна копиться в снимках
+    reset_form(update.effective_user.id)
     await update.message.reply_text(
         "Здравствуйте! Я бот-администратор салона красоты. Чем могу помочь?",
         reply_markup=main_keyboard
     )
     return CHOOSING
 
+@telegram_log_context
+@profiled('handle_service_choice')
 async def handle_service_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка выбора услуги"""
     user_message = update.message.text
     
-    if user_message == 'Быстрая запись':
+    if user_message == 'Быстрая запись' or is_booking_intent(user_message):
+        # Намерение записаться ведем по кнопочному сценарию без обращения к ассистенту
+        reset_form(update.effective_user.id)
+        service = detect_service(user_message)
+        if service in ['Стрижка', 'Окрашивание', 'Маникюр']:
+            set_form_field(update.effective_user.id, 'service', service)
         await update.message.reply_text(
             "Как я могу к вам обращаться? Пожалуйста, напишите ваше имя.",
             reply_markup=ReplyKeyboardRemove()
         )
         return TYPING_NAME
     elif user_message == 'Консультация' or user_message.lower() != 'быстрая запись':
-        # Добавляем сообщение пользователя в историю
         user_id = str(update.effective_user.id)
+        
+        # Локальный фильтр спама до обращения к ассистенту
+        allowed, reason = spam_filter.check(user_message, user_id)
+        if not allowed:
+            await update.message.reply_text(rejection_reply(reason), reply_markup=main_keyboard)
+            return CHOOSING
+        
+        # Добавляем сообщение пользователя в историю
         history = user_histories.get(user_id, [])
         history.append({"role": "user", "content": user_message})
         
         try:
             # Получаем ответ от OpenAI Assistant
-            print(f"Отправляем запрос ассистенту: {user_message}")
-            answer = ask_openai_assistant(history)
-            print(f"Получен ответ: {answer}")
+            logger.debug("Сообщение: %s", user_message)
+            llm_started = time.perf_counter()
+            await update.message.chat.send_action(ChatAction.TYPING)
+            # Запрос к ассистенту в отдельном потоке, чтобы не останавливать цикл событий бота
+            answer = await asyncio.to_thread(ask_openai_assistant, history, user_id)
+            logger.debug("Ответ ассистента: %s", answer)
+            logger.info("Консультация в Telegram", extra={'fields': {
+                'message_len': len(user_message),
+                'answer_len': len(answer),
+                'llm_ms': round((time.perf_counter() - llm_started) * 1000, 1),
+            }})
             
             # Сохраняем ответ в историю
             history.append({"role": "assistant", "content": answer})
@@ -354,7 +387,7 @@ async def handle_service_choice(update: Update, context: ContextTypes.DEFAULT_TY
                 reply_markup=main_keyboard
             )
         except Exception as e:
-            print(f"Ошибка при обработке запроса: {str(e)}")
+            logger.exception("Ошибка при обработке запроса: %s", e)
             await update.message.reply_text(
                 "Извините, произошла ошибка при обработке вашего вопроса. Попробуйте переформулировать или выберите 'Быстрая запись' для записи на услугу.",
                 reply_markup=main_keyboard
@@ -367,14 +400,16 @@ async def handle_service_choice(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return CHOOSING
 
+@telegram_log_context
 async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение имени и запрос телефона"""
-    user_data[update.effective_user.id] = {'name': update.message.text}
+    set_form_field(update.effective_user.id, 'name', update.message.text)
     await update.message.reply_text(
         "Спасибо! Теперь, пожалуйста, укажите ваш номер телефона в формате 79XXXXXXXXX"
     )
     return TYPING_PHONE
 
+@telegram_log_context
 async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение телефона и запрос услуги"""
     phone = update.message.text
@@ -384,17 +419,35 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return TYPING_PHONE
     
-    user_data[update.effective_user.id]['phone'] = phone
+    set_form_field(update.effective_user.id, 'phone', phone)
+    
+    # Постоянного клиента узнаем по телефону из локального зеркала (без запроса к Sheets).
+    # Имя и мастера показываем, только если с этим номером уже записывались из этого чата
+    client = client_mirror.lookup(phone)
+    if client and client_mirror.is_owner(phone, update.effective_chat.id):
+        if client.get('master'):
+            set_form_field(update.effective_user.id, 'usual_master', client['master'])
+        await update.message.reply_text(f"Рады видеть вас снова, {client.get('name') or user_data[update.effective_user.id]['name']}!")
+    
+    if 'service' in user_data[update.effective_user.id]:
+        # Услуга уже названа в первом сообщении
+        await update.message.reply_text(
+            "На какую дату вы хотели бы записаться? (например, '15 сентября')"
+        )
+        return TYPING_DATE
+    
     await update.message.reply_text(
         "Выберите услугу:",
         reply_markup=service_keyboard
     )
     return TYPING_SERVICE
 
+@telegram_log_context
 async def handle_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение услуги и запрос даты"""
     user_message = update.message.text
     if user_message == 'Отмена':
+        reset_form(update.effective_user.id)
         await update.message.reply_text(
             "Запись отменена. Чем еще могу помочь?",
             reply_markup=main_keyboard
@@ -408,25 +461,37 @@ async def handle_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return TYPING_SERVICE
     
-    user_data[update.effective_user.id]['service'] = user_message
+    set_form_field(update.effective_user.id, 'service', user_message)
     await update.message.reply_text(
         "На какую дату вы хотели бы записаться? (например, '15 сентября')",
         reply_markup=ReplyKeyboardRemove()
     )
     return TYPING_DATE
 
+@telegram_log_context
 async def handle_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение даты и запрос мастера"""
-    user_data[update.effective_user.id]['date'] = update.message.text
+    set_form_field(update.effective_user.id, 'date', update.message.text)
+    usual_master = user_data[update.effective_user.id].get('usual_master')
+    if usual_master:
+        await update.message.reply_text(
+            f"Записать вас, как обычно, к мастеру «{usual_master}»? Напишите 'как обычно' или укажите другого мастера"
+        )
+        return TYPING_MASTER
     await update.message.reply_text(
         "Укажите предпочтительного мастера (если нет предпочтений, напишите 'любой')"
     )
     return TYPING_MASTER
 
+@telegram_log_context
+@profiled('handle_master')
 async def handle_master(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Завершение записи"""
     user_id = update.effective_user.id
-    user_data[user_id]['master'] = update.message.text
+    master = update.message.text
+    if user_data[user_id].get('usual_master') and master.strip().lower() in ['как обычно', 'обычно', 'да']:
+        master = user_data[user_id]['usual_master']
+    set_form_field(user_id, 'master', master)
     
     # Формируем данные для сохранения
     data = {
@@ -440,12 +505,8 @@ async def handle_master(update: Update, context: ContextTypes.DEFAULT_TYPE):
     }
     
     try:
-        # Сохраняем в Google Sheets
-        save_application_to_sheets(data)
-        
-        # Отправляем уведомление в Telegram
-        notification_text = f"🎉 НОВАЯ ЗАЯВКА!\n\nИмя: {data['Имя']}\nТелефон: {data['Телефон']}\nУслуга: {data['Услуга']}\nДата: {data['Дата']}\nМастер: {data['Мастер']}\nИсточник: {data['Источник']}"
-        await send_telegram_notification(notification_text)
+        await finalize_application(data, chat_id=update.effective_chat.id)
+        reset_form(user_id)
         
         await update.message.reply_text(
             f"Отлично! Ваша запись оформлена:\n"
@@ -458,7 +519,7 @@ async def handle_master(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=main_keyboard
         )
     except Exception as e:
-        print(f"❌ Ошибка при сохранении заявки: {e}")
+        logger.exception("Ошибка при сохранении заявки: %s", e)
         await update.message.reply_text(
             "Извините, произошла ошибка при сохранении заявки. Пожалуйста, попробуйте позже.",
             reply_markup=main_keyboard
@@ -466,6 +527,13 @@ async def handle_master(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return CHOOSING
 
+@telegram_log_context
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /stats: статистика заявок, только в служебном чате"""
+    if str(update.effective_chat.id) != str(TELEGRAM_ADMIN_CHAT_ID):
+        return
+    await update.message.reply_text(format_stats(booking_analytics.stats()))
+
 # Регистрируем обработчики
 conv_handler = ConversationHandler(
     entry_points=[CommandHandler('start', start)],
@@ -477,9 +545,12 @@ conv_handler = ConversationHandler(
         TYPING_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_date)],
         TYPING_MASTER: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_master)],
     },
-    fallbacks=[CommandHandler('start', start)]
+    fallbacks=[CommandHandler('start', start)],
+    name='booking',
+    persistent=True
 )
 
+application.add_handler(CommandHandler('stats', stats_command))
 application.add_handler(conv_handler)
 
 def run_flask():
@@ -491,19 +562,31 @@ def run_telegram():
     try:
         application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
     except Exception as e:
-        print(f"❌ Ошибка в работе бота: {str(e)}")
-        print("Перезапуск бота через 5 секунд...")
+        logger.exception("Ошибка в работе бота: %s", e)
+        logger.info("Перезапуск бота через 5 секунд...")
         time.sleep(5)
         run_telegram()  # Рекурсивный перезапуск
 
 if __name__ == '__main__':
+    # Поднимаем очередь напоминаний (восстанавливается из базы после перезапуска)
+    reminder_scheduler.start()
+    
+    # Локальное зеркало таблицы заявок для узнавания постоянных клиентов
+    client_mirror.start(read_application_rows)
+    
+    # Счетчики аналитики пересчитываются по таблице один раз в фоне
+    booking_analytics.start_rebuild(lambda first, last: read_application_rows(first, last, last_column='H'))
+    
+    # Восстанавливаем незавершенные записи из журнала (снимок + хвост журнала)
+    state_journal.load()
+    user_data.update(state_journal.get_forms())
+
     # Запускаем Flask в отдельном потоке
     flask_thread = threading.Thread(target=run_flask)
     flask_thread.start()
     
-    print("Запуск Telegram бота...")
-    print("Бот готов к работе!")
-    print("Отправьте /start в Telegram для начала работы")
+    logger.info("Запуск Telegram бота...")
+    logger.info("Бот готов к работе! Отправьте /start в Telegram для начала работы")
     
     # Запускаем Telegram бота в основном потоке
     run_telegram()
\ No newline at end of file
@@ -0,0 +1,189 @@
+import os
+import sys
+import time
+import random
+import inspect
+import threading
+import functools
+from collections import Counter, defaultdict
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# === Настройки профилирования ===
+DEBUG_TOKEN = os.getenv('DEBUG_TOKEN')  # без токена отладочные эндпоинты отключены
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # доля профилируемых запросов, 0 - выключено
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))  # период сэмплирования, секунды
+MAX_PROFILE_SECONDS = 60
+MAX_STACK_DEPTH = 64
+
+
+def _fold_stack(frame) -> str:
+    """Сворачивает стек в строку 'корень;...;лист' (формат collapsed stacks для flamegraph)"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def format_folded(stacks: Counter) -> str:
+    """Текст для flamegraph.pl / speedscope: по строке 'стек количество'"""
+    return '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+
+_process_profile_lock = threading.Lock()
+
+
+def sample_process(seconds: float, interval: float = PROFILE_INTERVAL):
+    """
+    Сэмплирует стеки всех потоков процесса в течение seconds секунд.
+    Возвращает Counter свернутых стеков или None, если профилирование уже идет.
+    """
+    if not _process_profile_lock.acquire(blocking=False):
+        return None
+    try:
+        seconds = min(max(seconds, interval), MAX_PROFILE_SECONDS)
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own_ident = threading.get_ident()
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stacks[f"{names.get(ident, ident)};{_fold_stack(frame)}"] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _process_profile_lock.release()
+
+
+class HandlerProfiler:
+    """
+    Профилирование отдельных обработчиков на доле запросов.
+    Пока идет отобранный вызов, его поток регистрируется в _active,
+    а общий фоновый поток снимает стеки только этих потоков.
+    Для async-обработчиков сэмплы цикла событий включают и соседние корутины.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}  # ident потока: [имена обработчиков]
+        self._stacks = defaultdict(Counter)
+        self._calls = Counter()
+        self._total_time = Counter()
+        self._thread = None
+        self._has_active = threading.Event()  # поток сэмплера спит, пока нет отобранных вызовов
+
+    def _ensure_sampler(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='handler-profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._has_active.wait()
+            time.sleep(PROFILE_INTERVAL)
+            with self._lock:
+                if not self._active:
+                    continue
+                active = {ident: names[-1] for ident, names in self._active.items() if names}
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, handler in active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self._stacks[handler][_fold_stack(frame)] += 1
+
+    def enter(self, handler: str):
+        ident = threading.get_ident()
+        with self._lock:
+            self._ensure_sampler()
+            self._active.setdefault(ident, []).append(handler)
+            self._has_active.set()
+        return ident, time.perf_counter()
+
+    def exit(self, handler: str, token):
+        ident, started = token
+        with self._lock:
+            names = self._active.get(ident)
+            if names:
+                names.pop()
+                if not names:
+                    del self._active[ident]
+                    if not self._active:
+                        self._has_active.clear()
+            self._calls[handler] += 1
+            self._total_time[handler] += time.perf_counter() - started
+
+    def summary(self) -> dict:
+        """Сводка по обработчикам: число профилированных вызовов, время, сэмплы"""
+        with self._lock:
+            return {
+                handler: {
+                    'profiled_calls': calls,
+                    'total_ms': round(self._total_time[handler] * 1000, 1),
+                    'avg_ms': round(self._total_time[handler] * 1000 / calls, 1),
+                    'samples': sum(self._stacks[handler].values()),
+                }
+                for handler, calls in self._calls.items()
+            }
+
+    def folded(self, handler: str = None) -> str:
+        with self._lock:
+            if handler:
+                return format_folded(self._stacks.get(handler, Counter()))
+            merged = Counter()
+            for name, stacks in self._stacks.items():
+                for stack, count in stacks.items():
+                    merged[f"{name};{stack}"] += count
+            return format_folded(merged)
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._calls.clear()
+            self._total_time.clear()
+
+
+handler_profiler = HandlerProfiler()
+
+
+def set_sample_rate(rate: float):
+    """Меняет долю профилируемых вызовов на лету (0 - выключить)"""
+    global PROFILE_SAMPLE_RATE
+    PROFILE_SAMPLE_RATE = min(max(rate, 0.0), 1.0)
+
+
+def profiled(handler: str):
+    """
+    Декоратор для обработчиков (sync и async).
+    При PROFILE_SAMPLE_RATE = 0 стоимость - одна проверка глобальной переменной.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not PROFILE_SAMPLE_RATE or random.random() >= PROFILE_SAMPLE_RATE:
+                    return await func(*args, **kwargs)
+                token = handler_profiler.enter(handler)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    handler_profiler.exit(handler, token)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE_SAMPLE_RATE or random.random() >= PROFILE_SAMPLE_RATE:
+                return func(*args, **kwargs)
+            token = handler_profiler.enter(handler)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                handler_profiler.exit(handler, token)
+        return wrapper
+    return decorator
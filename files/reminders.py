@@ -0,0 +1,268 @@
+import os
+import re
+import time
+import heapq
+import asyncio
+import logging
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+import pytz
+from dotenv import load_dotenv
+from telegram import Bot
+from telegram.error import RetryAfter
+
+# Загружаем переменные окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# === Настройки напоминаний ===
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+TELEGRAM_ADMIN_CHAT_ID = os.getenv('TELEGRAM_ADMIN_CHAT_ID')
+SALON_TIMEZONE = pytz.timezone(os.getenv('SALON_TIMEZONE', 'Europe/Moscow'))
+REMINDERS_DB_PATH = os.getenv('REMINDERS_DB_PATH', 'reminders.db')
+REMINDER_HOUR = int(os.getenv('REMINDER_HOUR', '12'))  # "завтра в 12:00" - накануне визита
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '25'))
+REMINDER_RATE_PER_SECOND = float(os.getenv('REMINDER_RATE_PER_SECOND', '20'))  # лимит Telegram ~30 сообщений/с
+REMINDER_RETRY_DELAY = 60
+REMINDER_MAX_ATTEMPTS = 3
+
+MONTHS = {
+    'января': 1, 'февраля': 2, 'марта': 3, 'апреля': 4, 'мая': 5, 'июня': 6,
+    'июля': 7, 'августа': 8, 'сентября': 9, 'октября': 10, 'ноября': 11, 'декабря': 12
+}
+DATE_RE = re.compile(r'(\d{1,2})\s+(' + '|'.join(MONTHS) + r')')
+TIME_RE = re.compile(r'(\d{1,2})[:.](\d{2})')
+
+
+def parse_booking_date(text: str, now: datetime = None):
+    """
+    Разбирает дату записи из свободного текста ('15 сентября', 'завтра в 18:00').
+    Возвращает datetime в часовом поясе салона или None, если дату понять не удалось.
+    """
+    now = now or datetime.now(SALON_TIMEZONE)
+    content = text.lower()
+
+    match = DATE_RE.search(content)
+    if match:
+        day, month = int(match.group(1)), MONTHS[match.group(2)]
+        year = now.year
+        try:
+            date = datetime(year, month, day).date()
+            # Дата в прошлом - значит, клиент имеет в виду следующий год
+            if date < now.date():
+                date = datetime(year + 1, month, day).date()
+        except ValueError:
+            return None
+    elif 'послезавтра' in content:
+        date = now.date() + timedelta(days=2)
+    elif 'завтра' in content:
+        date = now.date() + timedelta(days=1)
+    elif 'сегодня' in content:
+        date = now.date()
+    else:
+        return None
+
+    hour, minute = 0, 0
+    time_match = TIME_RE.search(content)
+    if time_match and int(time_match.group(1)) < 24 and int(time_match.group(2)) < 60:
+        hour, minute = int(time_match.group(1)), int(time_match.group(2))
+
+    return SALON_TIMEZONE.localize(datetime(date.year, date.month, date.day, hour, minute))
+
+
+class ReminderScheduler:
+    """
+    Планировщик напоминаний о записи.
+    Очередь хранится в SQLite, в памяти - только куча (время, id), поэтому
+    десятки тысяч отложенных напоминаний не требуют ни потоков, ни опроса:
+    единственный рабочий поток спит ровно до ближайшего срока.
+    """
+
+    def __init__(self, db_path: str = REMINDERS_DB_PATH):
+        self.db_path = db_path
+        self._heap = []  # [(due_ts, reminder_id)]
+        self._cond = threading.Condition()
+        self._db = None
+        self._thread = None
+
+    def start(self):
+        """Открывает базу, восстанавливает очередь и запускает рабочий поток"""
+        with self._cond:
+            if self._thread:
+                return
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS reminders (
+                    id TEXT PRIMARY KEY,
+                    chat_id TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    due_ts REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # После падения: 'claimed' - взяты в пачку, но отправка не начиналась, их можно вернуть
+            # в очередь; 'sending' - сообщение могло уйти, поэтому повторно не отправляем
+            self._db.execute("UPDATE reminders SET status = 'pending' WHERE status = 'claimed'")
+            lost = self._db.execute("UPDATE reminders SET status = 'failed' WHERE status = 'sending'").rowcount
+            self._db.commit()
+            if lost:
+                logger.warning("Напоминаний с неизвестным итогом отправки (не повторяются): %d", lost)
+            self._heap = [(due_ts, reminder_id) for reminder_id, due_ts in self._db.execute(
+                "SELECT id, due_ts FROM reminders WHERE status = 'pending'"
+            )]
+            heapq.heapify(self._heap)
+            logger.info("Напоминаний в очереди: %d", len(self._heap))
+
+            self._thread = threading.Thread(target=self._run, name='reminders', daemon=True)
+            self._thread.start()
+
+    def schedule(self, reminder_id: str, chat_id, text: str, due: datetime) -> bool:
+        """
+        Ставит напоминание в очередь. Повторный вызов с тем же id ничего не делает,
+        поэтому повторное сохранение заявки не приводит к двойной отправке.
+        """
+        with self._cond:
+            if self._db is None:
+                logger.error("Планировщик напоминаний не запущен")
+                return False
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO reminders (id, chat_id, text, due_ts) VALUES (?, ?, ?, ?)",
+                (reminder_id, str(chat_id), text, due.timestamp())
+            )
+            self._db.commit()
+            if cursor.rowcount == 0:
+                return False
+            heapq.heappush(self._heap, (due.timestamp(), reminder_id))
+            # Будим рабочий поток, только если новое напоминание стало ближайшим
+            if self._heap[0][1] == reminder_id:
+                self._cond.notify()
+            return True
+
+    def _claim_due_batch(self):
+        """Забирает из кучи пачку наступивших напоминаний и помечает их 'claimed'"""
+        batch = []
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now and len(batch) < REMINDER_BATCH_SIZE:
+            _, reminder_id = heapq.heappop(self._heap)
+            cursor = self._db.execute(
+                "UPDATE reminders SET status = 'claimed', attempts = attempts + 1 "
+                "WHERE id = ? AND status = 'pending'",
+                (reminder_id,)
+            )
+            if cursor.rowcount:
+                row = self._db.execute(
+                    "SELECT chat_id, text, attempts FROM reminders WHERE id = ?", (reminder_id,)
+                ).fetchone()
+                batch.append((reminder_id, *row))
+        self._db.commit()
+        return batch
+
+    def _run(self):
+        """Рабочий цикл: ждет ближайший срок и отправляет напоминания пачками"""
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._cond.wait(timeout)
+                batch = self._claim_due_batch()
+
+            if batch:
+                done = set()  # id, чья отправка завершилась (успешно или с ошибкой)
+                failed = []
+                try:
+                    asyncio.run(self._send_batch(batch, done, failed))
+                except Exception as e:
+                    # Например, сеть недоступна уже при подключении бота
+                    logger.error("Ошибка отправки пачки напоминаний: %s", e)
+                failed += [(reminder_id, attempts) for reminder_id, _, _, attempts in batch if reminder_id not in done]
+                if failed:
+                    self._retry(failed)
+
+    async def _send_batch(self, batch, done: set, failed: list):
+        """
+        Отправляет пачку напоминаний с ограничением частоты; неотправленные добавляет в failed.
+        Статус пишется вокруг каждого сообщения: при падении процесса под вопросом
+        остается только одно напоминание ('sending'), и оно не повторяется.
+        """
+        interval = 1.0 / REMINDER_RATE_PER_SECOND
+        async with Bot(token=TELEGRAM_BOT_TOKEN) as reminder_bot:
+            for reminder_id, chat_id, text, attempts in batch:
+                self._set_status(reminder_id, 'sending')
+                try:
+                    try:
+                        await reminder_bot.send_message(chat_id=chat_id, text=text)
+                    except RetryAfter as e:
+                        await asyncio.sleep(e.retry_after)
+                        await reminder_bot.send_message(chat_id=chat_id, text=text)
+                    self._set_status(reminder_id, 'sent')
+                except Exception as e:
+                    logger.error("Ошибка отправки напоминания %s: %s", reminder_id, e)
+                    failed.append((reminder_id, attempts))
+                done.add(reminder_id)
+                await asyncio.sleep(interval)
+        logger.info("Отправлено напоминаний: %d из %d", len(batch) - len(failed), len(batch))
+
+    def _set_status(self, reminder_id: str, status: str):
+        with self._cond:
+            self._db.execute("UPDATE reminders SET status = ? WHERE id = ?", (status, reminder_id))
+            self._db.commit()
+
+    def _retry(self, failed):
+        """Возвращает неотправленные напоминания в очередь с задержкой"""
+        with self._cond:
+            due_ts = time.time() + REMINDER_RETRY_DELAY
+            for reminder_id, attempts in failed:
+                if attempts >= REMINDER_MAX_ATTEMPTS:
+                    self._db.execute("UPDATE reminders SET status = 'failed' WHERE id = ?", (reminder_id,))
+                    continue
+                self._db.execute(
+                    "UPDATE reminders SET status = 'pending', due_ts = ? WHERE id = ?",
+                    (due_ts, reminder_id)
+                )
+                heapq.heappush(self._heap, (due_ts, reminder_id))
+            self._db.commit()
+            self._cond.notify()
+
+
+reminder_scheduler = ReminderScheduler()
+
+
+def schedule_booking_reminder(data: dict, chat_id=None) -> bool:
+    """
+    Планирует напоминание накануне визита в REMINDER_HOUR по времени салона.
+    chat_id - чат клиента в Telegram; для заявок с сайта напоминание уходит
+    в служебный чат, чтобы администратор позвонил клиенту.
+    """
+    visit = parse_booking_date(data.get('Дата', ''))
+    if visit is None:
+        logger.info("Не удалось разобрать дату для напоминания: %s", data.get('Дата'))
+        return False
+
+    remind_at = SALON_TIMEZONE.localize(
+        datetime.combine(visit.date() - timedelta(days=1), datetime.min.time()).replace(hour=REMINDER_HOUR)
+    )
+    if remind_at <= datetime.now(SALON_TIMEZONE):
+        return False
+
+    if chat_id is not None:
+        target = chat_id
+        text = (
+            f"Здравствуйте, {data.get('Имя', '')}! Напоминаем, что завтра ({data.get('Дата')}) "
+            f"вы записаны на услугу «{data.get('Услуга')}». Мастер: {data.get('Мастер')}. Ждем вас!"
+        )
+    else:
+        target = TELEGRAM_ADMIN_CHAT_ID
+        text = (
+            f"⏰ НАПОМИНАНИЕ: завтра визит клиента\n\nИмя: {data.get('Имя')}\nТелефон: {data.get('Телефон')}\n"
+            f"Услуга: {data.get('Услуга')}\nДата: {data.get('Дата')}\nМастер: {data.get('Мастер')}"
+        )
+
+    key = f"{target}|{data.get('Телефон')}|{data.get('Услуга')}|{visit.isoformat()}"
+    reminder_id = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return reminder_scheduler.schedule(reminder_id, target, text, remind_at)
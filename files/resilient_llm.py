@@ -0,0 +1,190 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+from llm_backends import get_backend, StubBackend
+from shadow import shadow_runner
+
+# Загружаем переменные окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# === Настройки бюджета задержки ===
+LLM_LATENCY_BUDGET = float(os.getenv('LLM_LATENCY_BUDGET', '20'))  # секунд на ответ клиенту целиком
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '2'))  # не дублировать запрос раньше
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', '8'))  # пока нет статистики p95
+LLM_MAX_WORKERS = int(os.getenv('LLM_MAX_WORKERS', '16'))
+BREAKER_WINDOW = int(os.getenv('LLM_BREAKER_WINDOW', '20'))
+BREAKER_MIN_CALLS = int(os.getenv('LLM_BREAKER_MIN_CALLS', '5'))
+BREAKER_ERROR_RATE = float(os.getenv('LLM_BREAKER_ERROR_RATE', '0.5'))
+BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+
+STAFF_FALLBACK_ANSWER = (
+    "Извините, сейчас не получается быстро ответить на ваш вопрос. "
+    "Мы передали его администратору салона, и он свяжется с вами в ближайшее время."
+)
+
+
+class CircuitBreaker:
+    """
+    Размыкается, когда доля ошибок за последние BREAKER_WINDOW вызовов выше порога.
+    Через BREAKER_COOLDOWN пропускает один пробный вызов: успех замыкает цепь.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=BREAKER_WINDOW)
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < BREAKER_COOLDOWN or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record(self, success: bool):
+        with self._lock:
+            if self._opened_at is not None and self._trial_in_flight:
+                self._trial_in_flight = False
+                if success:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                else:
+                    self._opened_at = time.monotonic()
+                return
+            self._outcomes.append(success)
+            errors = self._outcomes.count(False)
+            if (self._opened_at is None and len(self._outcomes) >= BREAKER_MIN_CALLS
+                    and errors / len(self._outcomes) >= BREAKER_ERROR_RATE):
+                self._opened_at = time.monotonic()
+                logger.warning("LLM недоступен: цепь разомкнута", extra={'fields': {
+                    'errors': errors, 'calls': len(self._outcomes),
+                }})
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+
+class ResilientLLM:
+    """
+    Ответ ассистента в пределах бюджета задержки:
+    - если первый запрос не успел за p95 задержки бэкенда, параллельно отправляется второй (hedge);
+    - по истечении бюджета клиент получает ответ из базы знаний или сообщение,
+      что администратор ответит сам (вопрос пересылается в служебный чат);
+    - при высокой доле ошибок предохранитель не обращается к LLM вовсе.
+    """
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self._executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix='llm')
+        # Уведомления администратору не ждут в очереди за запросами к LLM
+        self._staff_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='llm-staff')
+        self._knowledge = None
+        self.staff_questions = deque(maxlen=100)  # последние вопросы, переданные администратору
+
+    def _hedge_delay(self, backend) -> float:
+        p95 = backend.stats.percentile(0.95)
+        delay = LLM_HEDGE_DEFAULT_DELAY if p95 is None else p95
+        return max(delay, LLM_HEDGE_MIN_DELAY)
+
+    def _attempt(self, backend, messages, deadline):
+        """Один запрос к бэкенду; для предохранителя ответ после дедлайна - тоже неудача"""
+        try:
+            result = backend.complete(messages)
+        except Exception:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(time.monotonic() <= deadline)
+        return result
+
+    def ask(self, messages: list, session_id=None) -> str:
+        started = time.monotonic()
+        deadline = started + LLM_LATENCY_BUDGET
+        if not self.breaker.allow():
+            return self._fallback(messages, session_id, 'circuit_open')
+
+        backend = get_backend()
+        pending = {self._executor.submit(self._attempt, backend, messages, deadline)}
+        hedged = False
+        hedge_at = started + self._hedge_delay(backend)
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            timeout = min(deadline, hedge_at) - now if not hedged else deadline - now
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning("Ошибка запроса к LLM: %s", e)
+                    continue
+                if hedged:
+                    logger.info("LLM ответил после дублирования запроса", extra={'fields': {
+                        'latency_ms': round(result.latency * 1000, 1),
+                    }})
+                shadow_runner.mirror(messages, result, session_id)
+                return result.text
+
+            # Дублируем запрос один раз: после p95 или сразу после ошибки первого
+            if not hedged and (time.monotonic() >= hedge_at or not pending):
+                hedged = True
+                if self.breaker.allow():
+                    pending.add(self._executor.submit(self._attempt, backend, messages, deadline))
+
+        # Еще не начатые попытки отменяем: их ответ никто не прочитает, а платить за него придется.
+        # Уже идущие дорабатывают в фоне (их ограничивает таймаут бэкенда).
+        # Отмененная попытка не дойдет до _attempt, поэтому учитываем ее как неудачу здесь,
+        # иначе отмененный пробный вызов навсегда оставил бы предохранитель разомкнутым
+        for future in pending:
+            if future.cancel():
+                self.breaker.record(False)
+        reason = 'timeout' if pending else 'error'
+        shadow_runner.mirror_failure(messages, backend.name, reason, time.monotonic() - started, session_id)
+        return self._fallback(messages, session_id, reason)
+
+    def summary(self) -> dict:
+        """Состояние предохранителя и последние вопросы, переданные администратору"""
+        return {
+            'circuit_open': self.breaker.is_open,
+            'staff_questions': list(self.staff_questions)[-10:],
+        }
+
+    def _fallback(self, messages, session_id, reason: str) -> str:
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), '')
+        if self._knowledge is None:
+            self._knowledge = StubBackend()
+        answer = self._knowledge.best_answer(question)
+        logger.warning("Ответ без LLM", extra={'fields': {
+            'reason': reason, 'knowledge_hit': answer is not None,
+        }})
+        if answer:
+            return answer
+
+        self.staff_questions.append({'session_id': session_id, 'question': question, 'time': time.time()})
+        self._staff_executor.submit(self._notify_staff, session_id, question)
+        return STAFF_FALLBACK_ANSWER
+
+    @staticmethod
+    def _notify_staff(session_id, question):
+        # Импорт здесь: functions импортирует этот модуль
+        from functions import send_telegram_notification
+        asyncio.run(send_telegram_notification(
+            f"❓ ВОПРОС БЕЗ ОТВЕТА\n\nКлиент: {session_id}\nВопрос: {question}\n\nАссистент не ответил вовремя, свяжитесь с клиентом."
+        ))
+
+
+resilient_llm = ResilientLLM()
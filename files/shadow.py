@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from llm_backends import create_backend
+
+# Загружаем переменные окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# === Настройки теневого режима ===
+SHADOW_RATE = float(os.getenv('SHADOW_RATE', '0'))  # доля ходов для кандидата, 0 - выключено
+SHADOW_BACKEND = os.getenv('SHADOW_BACKEND', 'chat')  # assistants | chat | stub
+SHADOW_MODEL = os.getenv('SHADOW_MODEL')
+SHADOW_PROMPT_PATH = os.getenv('SHADOW_PROMPT_PATH')
+SHADOW_ASSISTANT_ID = os.getenv('SHADOW_ASSISTANT_ID')
+SHADOW_LOG_PATH = os.getenv('SHADOW_LOG_PATH', 'shadow.jsonl')
+SHADOW_MAX_WORKERS = int(os.getenv('SHADOW_MAX_WORKERS', '2'))
+SHADOW_MAX_PENDING = int(os.getenv('SHADOW_MAX_PENDING', '20'))  # больше - ход пропускается
+SHADOW_REPORT_WINDOW = 1000
+
+
+def candidate_options() -> dict:
+    """Параметры кандидата для create_backend: заданы только те, что есть в окружении"""
+    options = {
+        'chat': {'model': SHADOW_MODEL, 'prompt_path': SHADOW_PROMPT_PATH},
+        'assistants': {'assistant_id': SHADOW_ASSISTANT_ID},
+    }.get(SHADOW_BACKEND, {})
+    return {key: value for key, value in options.items() if value}
+
+
+def _side(result) -> dict:
+    return {
+        'backend': result.backend,
+        'model': result.model,
+        'outcome': 'ok',
+        'latency_ms': round(result.latency * 1000, 1),
+        'input_tokens': result.input_tokens,
+        'cached_tokens': result.cached_tokens,
+        'output_tokens': result.output_tokens,
+        'cost_usd': round(result.cost, 6),
+        'answer_length': len(result.text),
+    }
+
+
+def _failed_side(backend: str, outcome: str, elapsed: float) -> dict:
+    """Ход без ответа (таймаут или ошибка): учитывается в задержке, но не в токенах и длине"""
+    return {
+        'backend': backend,
+        'model': '',
+        'outcome': outcome,
+        'latency_ms': round(elapsed * 1000, 1),
+        'input_tokens': 0,
+        'cached_tokens': 0,
+        'output_tokens': 0,
+        'cost_usd': 0.0,
+        'answer_length': 0,
+    }
+
+
+def _answered(side: dict) -> bool:
+    return side['outcome'] == 'ok'
+
+
+def _percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(records: list) -> dict:
+    """Сводка по парам 'текущий бэкенд / кандидат': задержка, токены, длина ответа"""
+    def side_summary(sides: list) -> dict:
+        # Задержка - по всем ходам, включая таймауты; токены и длина - только по ответам
+        answered = [s for s in sides if _answered(s)]
+        count = len(answered) or 1
+        latencies = [s['latency_ms'] for s in sides]
+        return {
+            'failures': len(sides) - len(answered),
+            'p50_latency_ms': _percentile(latencies, 0.5),
+            'p95_latency_ms': _percentile(latencies, 0.95),
+            'avg_input_tokens': round(sum(s['input_tokens'] for s in answered) / count, 1),
+            'avg_output_tokens': round(sum(s['output_tokens'] for s in answered) / count, 1),
+            'avg_answer_length': round(sum(s['answer_length'] for s in answered) / count, 1),
+            'cost_usd': round(sum(s['cost_usd'] for s in answered), 6),
+        }
+
+    primary = [r['primary'] for r in records]
+    candidate = [r['candidate'] for r in records]
+    report = {
+        'turns': len(records),
+        'candidate_errors': sum(not _answered(c) for c in candidate),
+        'primary': side_summary(primary),
+        'candidate': side_summary(candidate),
+    }
+    if records:
+        # Быстрее - только если кандидат действительно ответил
+        report['candidate_faster_share'] = round(sum(
+            _answered(c) and c['latency_ms'] < p['latency_ms'] for p, c in zip(primary, candidate)
+        ) / len(records), 3)
+        # Отношения по каждой паре: медиана устойчива к единичным выбросам
+        latency_ratio = _percentile(
+            [c['latency_ms'] / p['latency_ms'] for p, c in zip(primary, candidate) if p['latency_ms']], 0.5)
+        length_ratio = _percentile([c['answer_length'] / p['answer_length'] for p, c in zip(primary, candidate)
+                                    if _answered(p) and _answered(c) and p['answer_length']], 0.5)
+        report['median_latency_ratio'] = round(latency_ratio, 3) if latency_ratio is not None else None
+        report['median_length_ratio'] = round(length_ratio, 3) if length_ratio is not None else None
+    return report
+
+
+class ShadowRunner:
+    """
+    Теневой режим: доля SHADOW_RATE ответов ассистента повторяется на бэкенде-кандидате
+    (другая модель, промпт или ассистент). Клиент получает только ответ текущего бэкенда,
+    кандидат работает в отдельном пуле потоков. Пары результатов пишутся в SHADOW_LOG_PATH
+    (без текста сообщений) и в окно последних SHADOW_REPORT_WINDOW ходов для отчета.
+    """
+
+    def __init__(self, rate: float = SHADOW_RATE):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._candidate = None
+        self._executor = None
+        self._pending = 0
+        self.skipped = 0
+        self.records = deque(maxlen=SHADOW_REPORT_WINDOW)
+
+    def _get_candidate(self):
+        with self._lock:
+            if self._candidate is None:
+                self._candidate = create_backend(SHADOW_BACKEND, **candidate_options())
+                self._executor = ThreadPoolExecutor(max_workers=SHADOW_MAX_WORKERS, thread_name_prefix='shadow')
+                logger.info("Теневой режим: кандидат %s", SHADOW_BACKEND, extra={'fields': candidate_options()})
+            return self._candidate
+
+    def mirror(self, messages: list, primary_result, session_id=None):
+        """Отправляет ход кандидату с вероятностью rate; не блокирует и не бросает исключений"""
+        self._submit(messages, _side(primary_result), session_id)
+
+    def mirror_failure(self, messages: list, backend: str, outcome: str, elapsed: float, session_id=None):
+        """
+        Ход, на который текущий бэкенд не ответил (таймаут или ошибка).
+        Без таких ходов отчет завышал бы скорость текущего бэкенда на самых медленных запросах.
+        """
+        self._submit(messages, _failed_side(backend, outcome, elapsed), session_id)
+
+    def _submit(self, messages: list, primary_side: dict, session_id):
+        if self.rate <= 0 or random.random() >= self.rate:
+            return
+        try:
+            candidate = self._get_candidate()
+        except Exception as e:
+            logger.error("Теневой режим: не удалось создать кандидата: %s", e)
+            self.rate = 0
+            return
+        with self._lock:
+            if self._pending >= SHADOW_MAX_PENDING:
+                self.skipped += 1
+                return
+            self._pending += 1
+        # Копия истории: вызывающий код дописывает или очищает ее после ответа
+        self._executor.submit(self._run, candidate, list(messages), primary_side, session_id)
+
+    def _run(self, candidate, messages, primary_side, session_id):
+        record = {'ts': time.time(), 'session_id': str(session_id), 'primary': primary_side}
+        started = time.perf_counter()
+        try:
+            record['candidate'] = _side(candidate.complete(messages))
+        except Exception as e:
+            record['candidate'] = _failed_side(candidate.name, 'error', time.perf_counter() - started)
+            record['candidate_error'] = str(e)
+        finally:
+            with self._lock:
+                self._pending -= 1
+        self._write(record)
+
+    def _write(self, record: dict):
+        with self._lock:
+            self.records.append(record)
+            try:
+                with open(SHADOW_LOG_PATH, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            except OSError as e:
+                logger.error("Теневой режим: ошибка записи %s: %s", SHADOW_LOG_PATH, e)
+
+    def report(self) -> dict:
+        """Сводка по последним ходам в памяти"""
+        with self._lock:
+            records = list(self.records)
+            pending, skipped = self._pending, self.skipped
+        return {
+            'rate': self.rate,
+            'candidate_backend': {'backend': SHADOW_BACKEND, **candidate_options()},
+            'pending': pending,
+            'skipped': skipped,
+            **summarize(records),
+        }
+
+
+shadow_runner = ShadowRunner()
+
+
+def load_records(path: str = SHADOW_LOG_PATH) -> list:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == '__main__':
+    # Отчет по всему журналу: python shadow.py [shadow.jsonl]
+    path = sys.argv[1] if len(sys.argv) > 1 else SHADOW_LOG_PATH
+    print(json.dumps(summarize(load_records(path)), ensure_ascii=False, indent=2))
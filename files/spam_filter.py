@@ -0,0 +1,154 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# === Настройки фильтра ===
+MAX_MESSAGE_LENGTH = int(os.getenv('SPAM_MAX_MESSAGE_LENGTH', '1000'))
+IP_RATE_LIMIT = float(os.getenv('SPAM_IP_RATE_LIMIT', '20'))  # сообщений в минуту с одного IP
+SESSION_RATE_LIMIT = float(os.getenv('SPAM_SESSION_RATE_LIMIT', '10'))  # сообщений в минуту на сессию
+MAX_REPEATS = int(os.getenv('SPAM_MAX_REPEATS', '3'))  # одинаковых сообщений подряд
+BLOOM_ROTATE_SECONDS = int(os.getenv('SPAM_BLOOM_ROTATE_SECONDS', '3600'))
+MAX_TRACKED_KEYS = 50000
+MIN_REMEMBERED_LENGTH = 40
+
+SPAM_REPLY = "Извините, не удалось обработать сообщение. Пожалуйста, сформулируйте вопрос о наших услугах или запишитесь по телефону салона."
+RATE_LIMIT_REPLY = "Вы отправляете сообщения слишком часто. Пожалуйста, подождите немного и попробуйте снова."
+
+# Ключевые слова и фрагменты, типичные для рекламного спама (сравниваются по нормализованному тексту)
+SPAM_PATTERNS = [
+    'казино', 'casino', 'ставки', 'букмекер', 'криптовалют', 'crypto', 'bitcoin', 'биткоин',
+    'заработок', 'заработать', 'пассивный доход', 'инвестиц', 'viagra', 'виагра', 'микрозайм',
+    'продвижение сайт', 'раскрутк', 'porn', 'порно', 'эскорт', 'escort',
+    'click here', 'free money',
+]
+SPAM_RE = re.compile('|'.join(re.escape(p) for p in SPAM_PATTERNS))
+URL_RE = re.compile(r'https?://|www\.|t\.me/|\.(?:ru|com|net|io|xyz|top)\b')
+REPEATED_CHAR_RE = re.compile(r'(.)\1{14,}')
+WHITESPACE_RE = re.compile(r'\s+')
+SPAM_SCORE_THRESHOLD = 2
+
+
+class BloomFilter:
+    """Компактный фильтр Блума на bytearray (по умолчанию 2^20 бит = 128 КБ)"""
+
+    def __init__(self, size_bits: int = 1 << 20, hashes: int = 4):
+        self.size = size_bits
+        self.hashes = hashes
+        self.bits = bytearray(size_bits // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=4 * self.hashes).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[4 * i:4 * i + 4], 'little') % self.size
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class SpamFilter:
+    """
+    Дешевый локальный фильтр перед обращением к ассистенту:
+    лимиты частоты по IP и сессии, длина и повторы сообщения,
+    фильтр Блума недавно встреченного спама и простой классификатор по ключевым словам.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # ключ: (токены, время последнего обновления)
+        self._last_messages = {}  # session_id: (хеш сообщения, число повторов)
+        self._recent_spam = BloomFilter()
+        self._previous_spam = BloomFilter()
+        self._rotated_at = time.monotonic()
+
+    def _allow_rate(self, key: str, per_minute: float, now: float) -> bool:
+        """Token bucket: емкость per_minute, пополнение per_minute токенов в минуту"""
+        tokens, updated = self._buckets.get(key, (per_minute, now))
+        tokens = min(per_minute, tokens + (now - updated) * per_minute / 60.0)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return False
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+    def _cleanup(self, now: float):
+        """Не даем словарям расти бесконечно: выбрасываем давно неактивные ключи"""
+        if len(self._buckets) > MAX_TRACKED_KEYS:
+            self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < 60}
+        if len(self._last_messages) > MAX_TRACKED_KEYS:
+            self._last_messages.clear()
+        if now - self._rotated_at > BLOOM_ROTATE_SECONDS:
+            # Два поколения фильтра: помним спам за последние 1-2 периода
+            self._previous_spam, self._recent_spam = self._recent_spam, BloomFilter()
+            self._rotated_at = now
+
+    def _is_known_spam(self, normalized: str) -> bool:
+        return normalized in self._recent_spam or normalized in self._previous_spam
+
+    def _remember_spam(self, normalized: str):
+        self._recent_spam.add(normalized)
+
+    @staticmethod
+    def _spam_score(normalized: str) -> int:
+        """Оценка по ключевым словам и ссылкам: 2 и больше - спам"""
+        score = 2 * len(SPAM_RE.findall(normalized))
+        score += len(URL_RE.findall(normalized))
+        if REPEATED_CHAR_RE.search(normalized):
+            score += 2
+        return score
+
+    def check(self, message: str, session_id: str, ip: str = None):
+        """
+        Проверяет сообщение. Возвращает (True, '') если его можно передать ассистенту,
+        иначе (False, причина): 'rate_limit', 'too_long', 'repeat', 'spam'.
+        """
+        now = time.monotonic()
+        normalized = WHITESPACE_RE.sub(' ', message.lower()).strip()
+
+        with self._lock:
+            self._cleanup(now)
+
+            if ip and not self._allow_rate('ip:' + ip, IP_RATE_LIMIT, now):
+                return False, 'rate_limit'
+            if not self._allow_rate('session:' + session_id, SESSION_RATE_LIMIT, now):
+                return False, 'rate_limit'
+
+            if len(message) > MAX_MESSAGE_LENGTH:
+                self._remember_spam(normalized)
+                return False, 'too_long'
+
+            if self._is_known_spam(normalized):
+                return False, 'spam'
+
+            message_hash = hash(normalized)
+            last_hash, repeats = self._last_messages.get(session_id, (None, 0))
+            repeats = repeats + 1 if message_hash == last_hash else 1
+            self._last_messages[session_id] = (message_hash, repeats)
+            if repeats > MAX_REPEATS:
+                # Короткие фразы ("привет", "да") не заносим в общий фильтр, чтобы не блокировать других
+                if len(normalized) >= MIN_REMEMBERED_LENGTH:
+                    self._remember_spam(normalized)
+                return False, 'repeat'
+
+            if self._spam_score(normalized) >= SPAM_SCORE_THRESHOLD:
+                self._remember_spam(normalized)
+                return False, 'spam'
+
+        return True, ''
+
+
+spam_filter = SpamFilter()
+
+
+def rejection_reply(reason: str) -> str:
+    """Стандартный ответ на отклоненное сообщение"""
+    return RATE_LIMIT_REPLY if reason == 'rate_limit' else SPAM_REPLY
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+from telegram.ext import BasePersistence, PersistenceInput
+
+# Загружаем переменные окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# === Настройки журнала состояния ===
+STATE_JOURNAL_PATH = os.getenv('STATE_JOURNAL_PATH', 'state.journal')
+STATE_SNAPSHOT_PATH = os.getenv('STATE_SNAPSHOT_PATH', 'state.snapshot')
+JOURNAL_FSYNC_INTERVAL = float(os.getenv('JOURNAL_FSYNC_INTERVAL', '0.05'))  # окно группового fsync, секунды
+JOURNAL_SNAPSHOT_EVERY = int(os.getenv('JOURNAL_SNAPSHOT_EVERY', '20000'))  # записей журнала между снимками
+JOURNAL_PERSIST_INTERVAL = float(os.getenv('JOURNAL_PERSIST_INTERVAL', '0.5'))  # как часто PTB отдает состояния диалогов
+
+
+class StateJournal:
+    """
+    Журнал состояния диалогов Telegram: состояние ConversationHandler и поля анкеты.
+    Каждое изменение - строка JSON в конце файла; fsync выполняется пачкой раз в
+    JOURNAL_FSYNC_INTERVAL. Периодически состояние целиком пишется в компактный снимок,
+    а журнал обнуляется. При старте читается снимок и поверх него - журнал.
+    """
+
+    def __init__(self, journal_path: str = STATE_JOURNAL_PATH, snapshot_path: str = STATE_SNAPSHOT_PATH):
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.conversations = {}  # имя обработчика: {ключ (json): состояние}
+        self.forms = {}  # user_id (str): {поле: значение}
+        self._lock = threading.Lock()
+        self._file = None
+        self._records = 0
+        self._dirty = threading.Event()
+        self._flusher = None
+
+    # --- Восстановление ---
+    def load(self):
+        """Читает снимок и проигрывает журнал. Недописанная последняя строка отбрасывается"""
+        started = time.perf_counter()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.conversations = snapshot.get('conversations', {})
+            self.forms = snapshot.get('forms', {})
+
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            valid_end = 0  # конец последней полной строки
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        logger.warning("Журнал состояния: недописанная последняя запись отброшена")
+                        break
+                    valid_end += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.warning("Журнал состояния: поврежденная запись пропущена")
+                        continue
+                    self._apply(record)
+                    replayed += 1
+            # Обрезаем хвост, иначе следующая запись склеится с обрывком и пропадет при чтении
+            if valid_end < os.path.getsize(self.journal_path):
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(valid_end)
+                    os.fsync(f.fileno())
+
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+        self._records = replayed
+        self._flusher = threading.Thread(target=self._flush_loop, name='state-journal', daemon=True)
+        self._flusher.start()
+        logger.info("Состояние диалогов восстановлено", extra={'fields': {
+            'conversations': sum(len(c) for c in self.conversations.values()),
+            'forms': len(self.forms),
+            'replayed': replayed,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        }})
+
+    def _apply(self, record: dict):
+        kind = record['t']
+        if kind == 'conv':
+            states = self.conversations.setdefault(record['n'], {})
+            if record['s'] is None:
+                states.pop(record['k'], None)
+            else:
+                states[record['k']] = record['s']
+        elif kind == 'form':
+            self.forms.setdefault(record['u'], {})[record['f']] = record['v']
+        elif kind == 'drop':
+            self.forms.pop(record['u'], None)
+
+    # --- Запись ---
+    def _append(self, record: dict):
+        with self._lock:
+            self._apply(record)
+            if self._file is None:
+                return
+            self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+            self._records += 1
+            if self._records >= JOURNAL_SNAPSHOT_EVERY:
+                self._snapshot()
+        self._dirty.set()
+
+    def record_conversation(self, name: str, key, state):
+        self._append({'t': 'conv', 'n': name, 'k': json.dumps(list(key)), 's': state})
+
+    def record_field(self, user_id, field: str, value):
+        self._append({'t': 'form', 'u': str(user_id), 'f': field, 'v': value})
+
+    def drop_form(self, user_id):
+        self._append({'t': 'drop', 'u': str(user_id)})
+
+    def _flush_loop(self):
+        """Групповой fsync: все записи за окно JOURNAL_FSYNC_INTERVAL сбрасываются одним вызовом"""
+        while True:
+            self._dirty.wait()
+            time.sleep(JOURNAL_FSYNC_INTERVAL)
+            self._dirty.clear()
+            with self._lock:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def _snapshot(self):
+        """Пишет снимок атомарно (tmp + rename) и начинает журнал заново. Вызывается под _lock"""
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'conversations': self.conversations, 'forms': self.forms},
+                      f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # Если упадем до обнуления журнала, повторное проигрывание безопасно: записи идемпотентны
+        self._file.close()
+        self._file = open(self.journal_path, 'w', encoding='utf-8')
+        os.fsync(self._file.fileno())
+        self._records = 0
+
+    def snapshot(self):
+        with self._lock:
+            if self._file is not None:
+                self._snapshot()
+
+    # --- Чтение ---
+    def get_conversations(self, name: str) -> dict:
+        with self._lock:
+            return {tuple(json.loads(key)): state for key, state in self.conversations.get(name, {}).items()}
+
+    def get_forms(self) -> dict:
+        """Анкеты с ключами-int, как в main.user_data"""
+        with self._lock:
+            return {int(user_id): dict(fields) for user_id, fields in self.forms.items()}
+
+
+state_journal = StateJournal()
+
+
+class JournalPersistence(BasePersistence):
+    """Persistence для python-telegram-bot: хранит только состояния ConversationHandler в журнале"""
+
+    def __init__(self, journal: StateJournal = state_journal):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=False, callback_data=False),
+            update_interval=JOURNAL_PERSIST_INTERVAL,
+        )
+        self.journal = journal
+
+    async def get_conversations(self, name):
+        return self.journal.get_conversations(name)
+
+    async def update_conversation(self, name, key, new_state):
+        self.journal.record_conversation(name, key, new_state)
+
+    async def flush(self):
+        self.journal.snapshot()
+
+    # Остальные данные PTB не храним
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_user_data(self, user_id, data):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def drop_user_data(self, user_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,64 @@
+// Встраиваемый загрузчик веб-чата для сайта салона (Tilda).
+// Подключение: <script src="https://<сервер>/webchat/loader.js" async></script>
+// До клика по кнопке не загружается ничего, кроме этого скрипта.
+(function () {
+    if (window.__artbeautyWebchat) return;
+    window.__artbeautyWebchat = true;
+
+    var script = document.currentScript;
+    var origin = script ? new URL(script.src).origin : '';
+    var frame = null;
+
+    function preconnect() {
+        if (document.querySelector('link[data-webchat-preconnect]')) return;
+        var link = document.createElement('link');
+        link.rel = 'preconnect';
+        link.href = origin;
+        link.setAttribute('data-webchat-preconnect', '');
+        document.head.appendChild(link);
+    }
+
+    function toggle() {
+        if (!frame) {
+            frame = document.createElement('iframe');
+            frame.src = origin + '/webchat';
+            frame.title = 'Чат с салоном красоты';
+            frame.loading = 'lazy';
+            frame.style.cssText = 'position:fixed;right:20px;bottom:90px;width:360px;max-width:calc(100vw - 40px);' +
+                'height:520px;max-height:calc(100vh - 120px);border:0;border-radius:10px;' +
+                'box-shadow:0 2px 10px rgba(0,0,0,0.2);background:#fff;z-index:2147483000;';
+            document.body.appendChild(frame);
+            return;
+        }
+        frame.style.display = frame.style.display === 'none' ? '' : 'none';
+    }
+
+    function mount() {
+        var button = document.createElement('button');
+        button.type = 'button';
+        button.textContent = '💬';
+        button.setAttribute('aria-label', 'Открыть чат с салоном');
+        button.style.cssText = 'position:fixed;right:20px;bottom:20px;width:56px;height:56px;border:0;' +
+            'border-radius:50%;background:#007bff;color:#fff;font-size:26px;cursor:pointer;' +
+            'box-shadow:0 2px 10px rgba(0,0,0,0.2);z-index:2147483000;';
+        button.addEventListener('mouseenter', preconnect, { once: true });
+        button.addEventListener('touchstart', preconnect, { once: true, passive: true });
+        button.addEventListener('click', toggle);
+        document.body.appendChild(button);
+    }
+
+    // Кнопку добавляем после загрузки страницы и в простое браузера, чтобы не мешать сайту
+    function schedule() {
+        if ('requestIdleCallback' in window) {
+            window.requestIdleCallback(mount, { timeout: 3000 });
+        } else {
+            setTimeout(mount, 1000);
+        }
+    }
+
+    if (document.readyState === 'complete') {
+        schedule();
+    } else {
+        window.addEventListener('load', schedule);
+    }
+})();
@@ -0,0 +1,70 @@
+const chatMessages = document.getElementById('chatMessages');
+const messageInput = document.getElementById('messageInput');
+const sendButton = document.getElementById('sendButton');
+
+// Внутри iframe от loader.js убираем отступы страницы
+if (window.self !== window.top) {
+    document.body.classList.add('embedded');
+}
+
+function addMessage(text, isUser = false) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${isUser ? 'user-message' : 'bot-message'}`;
+    messageDiv.textContent = text;
+    chatMessages.appendChild(messageDiv);
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+// Создаем постоянный ID для сессии
+let sessionId = localStorage.getItem('webchat_session_id');
+if (!sessionId) {
+    sessionId = 'web_' + Date.now();
+    localStorage.setItem('webchat_session_id', sessionId);
+}
+
+async function sendMessage() {
+    const message = messageInput.value.trim();
+    if (!message) return;
+
+    addMessage(message, true);
+    messageInput.value = '';
+    sendButton.disabled = true;
+    sendButton.textContent = 'Отправляется...';
+
+    try {
+        const response = await fetch('/webchat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                message: message,
+                user_id: sessionId
+            })
+        });
+
+        const data = await response.json();
+
+        if (data.answer) {
+            addMessage(data.answer);
+        } else {
+            addMessage('Извините, произошла ошибка. Попробуйте позже.');
+        }
+    } catch (error) {
+        console.error('Ошибка:', error);
+        addMessage('Извините, произошла ошибка соединения. Попробуйте позже.');
+    } finally {
+        sendButton.disabled = false;
+        sendButton.textContent = 'Отправить';
+        messageInput.focus();
+    }
+}
+
+sendButton.addEventListener('click', sendMessage);
+messageInput.addEventListener('keypress', (e) => {
+    if (e.key === 'Enter') {
+        sendMessage();
+    }
+});
+
+messageInput.focus();
@@ -0,0 +1,112 @@
+import os
+import gzip
+import hashlib
+import logging
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # без brotli отдаем gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# === Статика веб-виджета ===
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'webchat')
+STATIC_URL = '/webchat/static/'
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+}
+
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'  # адреса с хешем содержимого
+CACHE_LOADER = 'public, max-age=3600'  # loader.js встраивается по постоянному адресу
+CACHE_REVALIDATE = 'no-cache'  # страница чата: всегда проверять ETag
+
+
+class StaticAsset:
+    """Файл виджета, заранее сжатый gzip и brotli, со строгим ETag по содержимому"""
+
+    def __init__(self, name: str, body: bytes):
+        self.name = name
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream')
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        base, ext = os.path.splitext(name)
+        self.hashed_name = f"{base}.{self.digest}{ext}"
+        # Для каждого кодирования свой строгий ETag, как требует RFC 9110
+        self.variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11)
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}-{encoding}"'
+
+
+class AssetRegistry:
+    """Загружает статику один раз при старте и подставляет в HTML адреса с хешами"""
+
+    def __init__(self, directory: str = STATIC_DIR):
+        self.directory = directory
+        self.assets = {}  # имя файла (обычное и с хешем): StaticAsset
+        self.page = None
+        self.load()
+
+    def load(self):
+        names = sorted(n for n in os.listdir(self.directory) if n != 'index.html')
+        for name in names:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                asset = StaticAsset(name, f.read())
+            self.assets[name] = asset
+            self.assets[asset.hashed_name] = asset
+
+        with open(os.path.join(self.directory, 'index.html'), encoding='utf-8') as f:
+            html = f.read()
+        for name in names:
+            html = html.replace('{{' + name + '}}', STATIC_URL + self.assets[name].hashed_name)
+        self.page = StaticAsset('index.html', html.encode('utf-8'))
+        logger.info("Статика веб-чата загружена", extra={'fields': {
+            'files': names, 'brotli': brotli is not None,
+        }})
+
+    def get(self, name: str):
+        return self.assets.get(name)
+
+
+def _choose_encoding(asset: StaticAsset, accept_encoding: str) -> str:
+    """Выбирает лучшее доступное кодирование по Accept-Encoding (br > gzip > без сжатия)"""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token.strip().lower()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.variants and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def asset_response(asset: StaticAsset, request, cache_control: str) -> Response:
+    """Ответ с учетом If-None-Match (304) и Accept-Encoding"""
+    encoding = _choose_encoding(asset, request.headers.get('Accept-Encoding', ''))
+    headers = {
+        'ETag': asset.etag(encoding),
+        'Cache-Control': cache_control,
+        'Vary': 'Accept-Encoding',
+    }
+
+    # Любое представление с тем же содержимым считаем неизменившимся
+    if_none_match = request.headers.get('If-None-Match', '')
+    if if_none_match:
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        if '*' in tags or any(tag.startswith(f'"{asset.digest}-') for tag in tags):
+            return Response(status=304, headers=headers)
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(asset.variants[encoding], status=200, headers=headers, content_type=asset.content_type)